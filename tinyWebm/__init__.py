@@ -1,2 +1,2 @@
 # __init__.py=
-__all__ = ["__main__", "config", "helpers", "encoder"]
+__all__ = ["__main__", "config", "helpers", "encoder", "history", "governor", "pipeline", "service", "streams", "profiles", "backends", "cache", "ratecontrol", "simulator", "benchmark"]
@@ -0,0 +1,126 @@
+# backends.py
+from . import config
+from .profiles import selectProfile
+
+
+class VideoBackend:
+    """
+    Maps the common description of a video encode (bitrate, output tier,
+    speed, per-job profile) to one encoder's ffmpeg arguments, and says how
+    that encoder runs its passes and reports progress.
+    """
+
+    codec = None
+    two_pass = True
+    rss_factor = 1.0 # encoder memory relative to libvpx, for the governor
+
+    def defaultSpeed(self, test_only):
+        """Encoder speed setting for sample encodes or the full encode."""
+        raise NotImplementedError
+
+    def selectProfile(self, src_pix_fmt, resolution, fps, target_pix_fmt=None):
+        return selectProfile(src_pix_fmt, resolution, fps, target_pix_fmt)
+
+    def videoArgs(self, v_bitrate_str, fps, resolution, speed, threads, profile):
+        """Return the ffmpeg output arguments for the video stream."""
+        raise NotImplementedError
+
+    def passArgs(self, pass_number, passlogfile):
+        """Extra output arguments for pass 1 or 2 of a two-pass encode."""
+        return {'pass': pass_number, 'passlogfile': passlogfile}
+
+    def progressMs(self, line):
+        """Encoded media time in ms from one `-progress` line, or None."""
+        if line.startswith("out_time_ms="):
+            try:
+                # despite its name, ffmpeg reports out_time_ms in microseconds
+                return int(line.split("=", 1)[1]) // 1000
+            except ValueError:
+                return None
+        return None
+
+
+class LibvpxVp9Backend(VideoBackend):
+    codec = "libvpx-vp9"
+
+    def defaultSpeed(self, test_only):
+        return config.VIDEO_SAMPLE_CPU_USED if test_only else config.VIDEO_CPU_USED
+
+    def videoArgs(self, v_bitrate_str, fps, resolution, speed, threads, profile):
+        return {
+            'vcodec': self.codec,
+            'b:v': v_bitrate_str,
+            'g': min(int(fps * 10), 300),
+            'qmin': config.VIDEO_QMIN,
+            'qmax': config.VIDEO_QMAX,
+            'r': fps,
+            's': resolution,
+            'undershoot-pct': config.VIDEO_UNDERSHOOT_PCT,
+            'overshoot-pct': config.VIDEO_OVERSHOOT_PCT,
+            'lag-in-frames': profile['lag_in_frames'],
+            'tune': profile['tune'],
+            'quality': config.VIDEO_QUALITY,
+            'cpu-used': speed,
+            'auto-alt-ref': profile['auto_alt_ref'],
+            'arnr-maxframes': profile['arnr_maxframes'],
+            'arnr-strength': profile['arnr_strength'],
+            'aq-mode': config.VIDEO_AQ_MODE,
+            'row-mt': config.VIDEO_ROW_MT,
+            'tile-columns': config.VIDEO_TILE_COLUMNS,
+            'tile-rows': config.VIDEO_TILE_ROWS,
+            'enable-tpl': config.VIDEO_ENABLE_TPL,
+            'profile:v': profile['profile'],
+        }
+
+
+class SvtAv1Backend(VideoBackend):
+    """
+    SVT-AV1 scales across many more cores than libvpx. ffmpeg's libsvtav1
+    wrapper has no two-pass stats file, so it runs a single VBR pass with
+    lookahead and the iterativeEncode loop does the size correction.
+    """
+
+    codec = "libsvtav1"
+    two_pass = False
+    rss_factor = 2.0
+
+    def defaultSpeed(self, test_only):
+        return config.SVTAV1_SAMPLE_PRESET if test_only else config.SVTAV1_PRESET
+
+    def videoArgs(self, v_bitrate_str, fps, resolution, speed, threads, profile):
+        params = {
+            'rc': 1, # VBR
+            'lookahead': profile['lag_in_frames'],
+            'undershoot-pct': config.VIDEO_UNDERSHOOT_PCT,
+            'overshoot-pct': config.VIDEO_OVERSHOOT_PCT,
+        }
+        if config.SVTAV1_LOGICAL_PROCESSORS:
+            params['lp'] = config.SVTAV1_LOGICAL_PROCESSORS
+        params.update(config.SVTAV1_PARAMS)
+        return {
+            'vcodec': self.codec,
+            'b:v': v_bitrate_str,
+            'g': min(int(fps * 10), 300),
+            'qmin': config.VIDEO_QMIN,
+            'qmax': config.VIDEO_QMAX,
+            'r': fps,
+            's': resolution,
+            'preset': speed,
+            'svtav1-params': ":".join(f"{k}={v}" for k, v in params.items()),
+        }
+
+
+BACKENDS = {
+    backend.codec: backend
+    for backend in (LibvpxVp9Backend(), SvtAv1Backend())
+}
+
+
+def getBackend(video_codec=None):
+    """Return the backend for an ffmpeg video encoder name (default config.VIDEO_CODEC)."""
+    video_codec = video_codec or config.VIDEO_CODEC
+    try:
+        return BACKENDS[video_codec]
+    except KeyError:
+        raise ValueError(f"Unsupported video codec: {video_codec} "
+                         f"(available: {', '.join(sorted(BACKENDS))})")
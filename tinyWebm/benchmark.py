@@ -0,0 +1,91 @@
+# benchmark.py
+#
+# Speed/size table for encoder profiles on your own sources:
+#
+#     python -m tinyWebm.benchmark source1.mkv [source2.mp4 ...]
+#
+# Every source is sample-encoded (config.SAMPLE_SECONDS, test_only) once per
+# bitrate tier and variant (backend + profile override); the table shows wall
+# time, encode fps and output size relative to the default libvpx-vp9 profile.
+import sys
+import time
+
+import psutil
+
+from . import config
+from .encoder import encodeFile
+from .backends import getBackend
+from .helpers import computeBitrates, getSourceParams
+
+# one video bitrate inside each adaptSettings tier, 1080p down to 128x72
+TIER_BITRATES = [4_000_000, 2_000_000, 1_000_000, 500_000, 250_000, 120_000, 60_000]
+
+# name -> (video codec, encodeFile profile override); None = what the backend picks
+VARIANTS = {
+    'auto': ('libvpx-vp9', None),
+    '10bit': ('libvpx-vp9', {'pix_fmt': 'yuv420p10le'}),
+    '8bit': ('libvpx-vp9', {'pix_fmt': 'yuv420p'}),
+    'av1': ('libsvtav1', None),
+}
+
+
+def benchmarkSource(path, threads, variants=VARIANTS, bitrates=TIER_BITRATES):
+    """Return one result dict per (tier bitrate, variant) for the source at path."""
+    source_info = getSourceParams(path)
+    if not source_info:
+        raise ValueError(f"Failed to retrieve source parameters for {path}")
+    seconds = min(config.SAMPLE_SECONDS, source_info['duration_sec'])
+
+    results = []
+    for v_bps in bitrates:
+        _, a_bps = computeBitrates(v_bps)
+        for name, (video_codec, override) in variants.items():
+            stats = {}
+            start = time.time()
+            size, _, _ = encodeFile(path, None, v_bps, a_bps, seconds,
+                                    config.PASSLOGFILE, config.TARGET_CONTAINER, None, threads,
+                                    cpu_used=getBackend(video_codec).defaultSpeed(False),
+                                    test_only=True, test_seconds=seconds, stats=stats,
+                                    job_class='background', profile=override,
+                                    video_codec=video_codec)
+            wall = time.time() - start
+            results.append({
+                'source': path,
+                'variant': name,
+                'video_codec': video_codec,
+                'v_bps': v_bps,
+                'resolution': stats.get('resolution'),
+                'pix_fmt': stats.get('pix_fmt'),
+                'wall_sec': wall,
+                'encode_fps': seconds * (stats.get('fps') or 0) / wall if wall else 0,
+                'size_bytes': size,
+            })
+    return results
+
+
+def printTable(results):
+    baseline = {(r['source'], r['v_bps']): r for r in results if r['variant'] == 'auto'}
+    print(f"{'source':<28} {'tier':>10} {'variant':>8} {'codec':>10} {'pix_fmt':>12} "
+          f"{'sec':>7} {'fps':>7} {'KiB':>8} {'size':>6} {'time':>6}")
+    for r in results:
+        base = baseline.get((r['source'], r['v_bps']))
+        size_rel = r['size_bytes'] / base['size_bytes'] if base and base['size_bytes'] else 1.0
+        time_rel = r['wall_sec'] / base['wall_sec'] if base and base['wall_sec'] else 1.0
+        print(f"{r['source'][-28:]:<28} {r['resolution'] or '?':>10} {r['variant']:>8} {r['video_codec']:>10} "
+              f"{r['pix_fmt'] or '?':>12} {r['wall_sec']:7.1f} {r['encode_fps']:7.1f} "
+              f"{r['size_bytes']/1024:8.0f} {size_rel:6.3f} {time_rel:6.3f}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python -m tinyWebm.benchmark [source.*] ...")
+        sys.exit(2)
+
+    # timings must come from real encodes, not from the sample cache
+    config.SAMPLE_CACHE_ENABLED = False
+
+    threads = min(psutil.cpu_count() or 1, 8)
+    all_results = []
+    for source in sys.argv[1:]:
+        all_results.extend(benchmarkSource(source, threads))
+    printTable(all_results)
@@ -0,0 +1,200 @@
+# cache.py
+import hashlib
+import json
+import os
+import sqlite3
+import subprocess
+import threading
+import time
+
+from . import config
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    key         TEXT PRIMARY KEY,
+    size_bytes  INTEGER NOT NULL,
+    wall_sec    REAL NOT NULL,
+    created_at  REAL NOT NULL,
+    last_used   REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS samples_lru ON samples (last_used);
+CREATE TABLE IF NOT EXISTS starts (
+    key         TEXT PRIMARY KEY,
+    scale       REAL NOT NULL,
+    last_used   REAL NOT NULL
+);
+"""
+
+_conn = None
+_lock = threading.Lock()
+_fingerprints = {}   # (path, size, mtime_ns) -> fingerprint
+_ffmpeg_version = None
+
+
+def sourceFingerprint(path):
+    """
+    Content fingerprint of a source: sha256 over its size and sampled chunks
+    from the start, middle and end, so renamed or copied files still match
+    without hashing a whole movie. Memoised per (path, size, mtime).
+    """
+    st = os.stat(path)
+    memo_key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    if memo_key in _fingerprints:
+        return _fingerprints[memo_key]
+
+    chunk = config.SAMPLE_CACHE_FINGERPRINT_CHUNK_BYTES
+    digest = hashlib.sha256(str(st.st_size).encode())
+    with open(path, "rb") as f:
+        for offset in (0, max(st.st_size // 2 - chunk // 2, 0), max(st.st_size - chunk, 0)):
+            f.seek(offset)
+            digest.update(f.read(chunk))
+    fingerprint = digest.hexdigest()
+    _fingerprints[memo_key] = fingerprint
+    return fingerprint
+
+
+def _ffmpegVersion():
+    global _ffmpeg_version
+    if _ffmpeg_version is None:
+        try:
+            out = subprocess.run(["ffmpeg", "-version"], capture_output=True, text=True).stdout
+            _ffmpeg_version = out.splitlines()[0] if out else ""
+        except OSError:
+            _ffmpeg_version = ""
+    return _ffmpeg_version
+
+
+def sampleKey(input_file, target_container, *arg_dicts):
+    """
+    Cache key for one sample encode: source fingerprint plus every argument
+    that reaches ffmpeg (which includes the segment window) and the ffmpeg
+    build, so any change that could alter the output misses the cache.
+    """
+    args = {}
+    for d in arg_dicts:
+        args.update({k: str(v) for k, v in d.items()})
+    payload = json.dumps({
+        'source': sourceFingerprint(input_file),
+        'container': target_container,
+        'args': args,
+        'ffmpeg': _ffmpegVersion(),
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def startKey(input_file, video_codec, tier_res):
+    """Cache key for the starting bitrate scale of one source, backend and first tier."""
+    payload = json.dumps({
+        'source': sourceFingerprint(input_file),
+        'video_codec': video_codec,
+        'tier': tier_res,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _open():
+    global _conn
+    if not config.SAMPLE_CACHE_ENABLED:
+        return None
+    if _conn is None:
+        db_path = os.path.expanduser(config.SAMPLE_CACHE_DB)
+        try:
+            parent = os.path.dirname(db_path)
+            if parent:
+                os.makedirs(parent, exist_ok=True)
+            conn = sqlite3.connect(db_path, timeout=10, check_same_thread=False)
+            conn.executescript(_SCHEMA)
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"[WARN] Sample cache unavailable ({db_path}): {e}")
+            return None
+        _conn = conn
+    return _conn
+
+
+def _resolve(key):
+    return key() if callable(key) else key
+
+
+def lookup(key):
+    """
+    Return (size_bytes, wall_sec) for a cached sample, or None.
+    key may be a callable building it, so a disabled or unavailable cache
+    never fingerprints the source.
+    """
+    with _lock:
+        conn = _open()
+        if conn is None:
+            return None
+        try:
+            key = _resolve(key)
+            row = conn.execute("SELECT size_bytes, wall_sec FROM samples WHERE key = ?", (key,)).fetchone()
+            if row:
+                conn.execute("UPDATE samples SET last_used = ? WHERE key = ?", (time.time(), key))
+                conn.commit()
+        except sqlite3.Error as e:
+            print(f"[WARN] Could not read sample cache: {e}")
+            return None
+    return (row[0], row[1]) if row else None
+
+
+def store(key, size_bytes, wall_sec):
+    """
+    Remember a sample measurement and evict least recently used entries over
+    the limit. key may be a callable, as for lookup().
+    """
+    with _lock:
+        conn = _open()
+        if conn is None:
+            return
+        now = time.time()
+        try:
+            key = _resolve(key)
+            conn.execute("INSERT OR REPLACE INTO samples (key, size_bytes, wall_sec, created_at, last_used)"
+                         " VALUES (?, ?, ?, ?, ?)", (key, int(size_bytes), wall_sec, now, now))
+            conn.execute("DELETE FROM samples WHERE key IN (SELECT key FROM samples"
+                         " ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                         (config.SAMPLE_CACHE_MAX_ENTRIES,))
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"[WARN] Could not write sample cache: {e}")
+
+
+def lookupStartScale(key):
+    """
+    Return the starting bitrate scale a previous run of this source used, or
+    None. Re-runs reuse it so their sample bitrates, and so their sample
+    keys, match even after the job history has moved on. key may be a callable.
+    """
+    with _lock:
+        conn = _open()
+        if conn is None:
+            return None
+        try:
+            key = _resolve(key)
+            row = conn.execute("SELECT scale FROM starts WHERE key = ?", (key,)).fetchone()
+            if row:
+                conn.execute("UPDATE starts SET last_used = ? WHERE key = ?", (time.time(), key))
+                conn.commit()
+        except sqlite3.Error as e:
+            print(f"[WARN] Could not read sample cache: {e}")
+            return None
+    return row[0] if row else None
+
+
+def storeStartScale(key, scale):
+    """Remember the starting bitrate scale used for a source. key may be a callable."""
+    with _lock:
+        conn = _open()
+        if conn is None:
+            return
+        try:
+            key = _resolve(key)
+            conn.execute("INSERT OR REPLACE INTO starts (key, scale, last_used) VALUES (?, ?, ?)",
+                         (key, scale, time.time()))
+            conn.execute("DELETE FROM starts WHERE key IN (SELECT key FROM starts"
+                         " ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                         (config.SAMPLE_CACHE_MAX_ENTRIES,))
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"[WARN] Could not write sample cache: {e}")
@@ -7,7 +7,7 @@ PASSLOGFILE = "ffmpeg2pass"
 # ---- user-visible target: 10 MiB (bytes) ----
 TARGET_FILESIZE_BYTES = 10 * 1024 * 1024 # 10 MiB in BYTES
 TARGET_CONTAINER = "webm"
-TARGET_PIX_FORMAT = "yuv420p10le"
+TARGET_PIX_FORMAT = None # None = per job from the source bit depth (profiles.py)
 
 
 # ---- general settings ----
@@ -23,6 +23,7 @@ AUDIO_FRAME_DURATION = "60"
 
 
 # ---- video defaults ----
+# backend per job, see backends.py: "libvpx-vp9" or "libsvtav1"
 VIDEO_CODEC = "libvpx-vp9"
 
 
@@ -36,6 +37,7 @@ VIDEO_CRF = 1
 VIDEO_TUNE = "ssim"
 VIDEO_QUALITY = "good"
 VIDEO_CPU_USED = "3"
+VIDEO_SAMPLE_CPU_USED = "5" # faster setting for the test_only sample encodes
 VIDEO_AUTO_ALT_REF = 1
 VIDEO_ARNR_MAXFRAMES = 7
 VIDEO_ARNR_STRENGTH = 4
@@ -44,9 +46,97 @@ VIDEO_ROW_MT = 1
 VIDEO_TILE_COLUMNS = 1
 VIDEO_TILE_ROWS = 0
 VIDEO_ENABLE_TPL = 1
-VIDEO_PROFILE = 2
 VIDEO_LAG_IN_FRAMES = 25
 
 
+# ---- SVT-AV1 backend (VIDEO_CODEC = "libsvtav1") ----
+SVTAV1_PRESET = 6
+SVTAV1_SAMPLE_PRESET = 10
+SVTAV1_LOGICAL_PROCESSORS = None # None = let SVT-AV1 use every core
+SVTAV1_PARAMS = {'tune': 0, 'scd': 1, 'enable-overlays': 1} # extra svtav1-params
+
+
+# ---- per-job encoder profile (profiles.py) ----
+# 10-bit only pays off for sources that are already high bit depth
+PROFILE_FORCE_HIGH_BITDEPTH = False
+PROFILE_LAG_MAX_SECONDS = 2.0 # cap lookahead at this much video at the output fps
+# (min output height, settings), highest first. Starting points; re-check
+# with `python -m tinyWebm.benchmark` on representative sources.
+PROFILE_TIERS = [
+    (720, {'lag_in_frames': VIDEO_LAG_IN_FRAMES, 'arnr_maxframes': VIDEO_ARNR_MAXFRAMES,
+           'arnr_strength': VIDEO_ARNR_STRENGTH, 'auto_alt_ref': VIDEO_AUTO_ALT_REF, 'tune': VIDEO_TUNE}),
+    (360, {'lag_in_frames': VIDEO_LAG_IN_FRAMES, 'arnr_maxframes': 5,
+           'arnr_strength': 3, 'auto_alt_ref': VIDEO_AUTO_ALT_REF, 'tune': VIDEO_TUNE}),
+    (240, {'lag_in_frames': 16, 'arnr_maxframes': 4,
+           'arnr_strength': 3, 'auto_alt_ref': VIDEO_AUTO_ALT_REF, 'tune': VIDEO_TUNE}),
+    (0,   {'lag_in_frames': 12, 'arnr_maxframes': 3,
+           'arnr_strength': 2, 'auto_alt_ref': VIDEO_AUTO_ALT_REF, 'tune': VIDEO_TUNE}),
+]
+
+
 # default sample seconds used for quick test encode
 SAMPLE_SECONDS = 60
+
+
+# ---- job history (per-pass outcomes, used to predict ETA and starting bitrate) ----
+HISTORY_ENABLED = True
+HISTORY_DB = "~/.cache/tinywebm/history.sqlite3"
+HISTORY_MIN_SAMPLES = 3 # similar passes needed before a prediction is trusted
+HISTORY_MAX_NEIGHBOURS = 20
+HISTORY_MAX_SCALE = 1.25 # clamp on the predicted starting-bitrate correction
+
+
+# ---- resource governor (admission and throttling of ffmpeg children) ----
+GOVERNOR_ENABLED = True
+GOVERNOR_POLL_SEC = 1.0
+GOVERNOR_MAX_CHILDREN = None # None = limited by memory/CPU headroom only
+GOVERNOR_MAX_CPU_PERCENT = 90 # hold new passes while the host is this busy
+GOVERNOR_MEMORY_RESERVE_BYTES = 512 * 1024 * 1024 # never plan to use the last 512 MiB
+GOVERNOR_PAUSE_BELOW_BYTES = 256 * 1024 * 1024 # SIGSTOP low-priority passes below this
+GOVERNOR_RESUME_ABOVE_BYTES = 1024 * 1024 * 1024 # SIGCONT them again above this
+GOVERNOR_SWAP_IN_BYTES = 64 * 1024 * 1024 # swap-in per poll that counts as thrashing
+GOVERNOR_BASE_RSS_BYTES = 96 * 1024 * 1024 # ffmpeg + libvpx baseline
+GOVERNOR_RSS_FUDGE = 2.0 # row-mt/tiles and encoder internals on top of frame buffers
+
+# rank: lower is more important. pausable classes may be SIGSTOPped under pressure.
+GOVERNOR_JOB_CLASSES = {
+    'final':      {'rank': 0, 'nice': 5,  'ionice': 4,      'pausable': False},
+    'sample':     {'rank': 1, 'nice': 10, 'ionice': 6,      'pausable': True},
+    'background': {'rank': 2, 'nice': 19, 'ionice': 'idle', 'pausable': True},
+}
+
+
+# ---- encode service (python -m tinyWebm --serve) ----
+SERVICE_QUEUE_DB = "~/.cache/tinywebm/queue.sqlite3"
+SERVICE_HOST = "127.0.0.1" # local only; the API has no authentication
+SERVICE_PORT = 8765
+SERVICE_WORKERS = 2
+SERVICE_THREADS_PER_JOB = None # None = same as a single run (min(cpu count, 8))
+SERVICE_POLL_SEC = 1.0
+SERVICE_PROGRESS_INTERVAL_SEC = 2.0
+SERVICE_SHUTDOWN_GRACE_SEC = 10.0 # wait this long for workers to clean up on shutdown
+SERVICE_WATCH_DIR = None # e.g. "~/tinywebm/inbox"
+SERVICE_WATCH_OUTPUT_DIR = None # defaults to the watch folder itself
+SERVICE_WATCH_POLL_SEC = 5.0
+SERVICE_WATCH_JOB_CLASS = "background"
+
+
+# ---- streaming inputs/outputs ----
+SCRATCH_DIR = None # where non-seekable inputs are spooled; None = system temp dir
+STREAM_CHUNK_BYTES = 1024 * 1024
+
+
+# ---- sample-encode cache (measured size/time of test_only encodes) ----
+SAMPLE_CACHE_ENABLED = True
+SAMPLE_CACHE_DB = "~/.cache/tinywebm/samples.sqlite3"
+SAMPLE_CACHE_MAX_ENTRIES = 20000 # least recently used entries beyond this are evicted
+SAMPLE_CACHE_FINGERPRINT_CHUNK_BYTES = 4 * 1024 * 1024
+
+
+# ---- retry-loop rate control (ratecontrol.py; try changes with tinyWebm.simulator) ----
+RC_TOLERANCE = 0.02 # accept a pass within 2% under target
+RC_ALPHA_OVER = 0.75 # correction gain when the pass came out too big
+RC_ALPHA_UNDER = 0.5 # correction gain when it came out too small
+RC_MAX_CORRECTION = 0.2 # clamp each step to +-20%
+RC_MIN_BPS_CHANGE = 500 # "no significant change" thresholds
+RC_MIN_SIZE_CHANGE_BYTES = 1024 * 50
@@ -9,6 +9,10 @@ import ffmpeg
 
 from .helpers import *
 from . import config
+from . import cache
+from .history import predictPassSeconds
+from .governor import getGovernor, governedPopen
+from .backends import getBackend
 
 def encodeFile(input_file, outfile, v_bps, a_bps, duration,
                passlogfile,
@@ -19,15 +23,38 @@ def encodeFile(input_file, outfile, v_bps, a_bps, duration,
                test_only=False,
                test_seconds=config.SAMPLE_SECONDS,
                video_codec=config.VIDEO_CODEC,
-               audio_codec=config.AUDIO_CODEC
+               audio_codec=config.AUDIO_CODEC,
+               stats=None,
+               expected_sec=None,
+               job_class=None,
+               progress=None,
+               profile=None
                ):
     """
     Encode a file (or test encode if test_only=True).
     Returns (file_size_bytes, used_video_bps, used_audio_bps)
+
+    If stats is a dict it is filled with the settings actually used (tier,
+    cpu_used, threads) and the wall time of each ffmpeg pass; 'cached' is
+    set when a test encode was answered from the sample cache.
+    expected_sec is an optional (pass1_sec, pass2_sec) prediction that seeds
+    the progress ETA until enough of the pass has run to measure it; by
+    default it is looked up in the job history.
+    job_class selects the governor priority ('final', 'sample', 'background');
+    it defaults to 'sample' for test encodes and 'final' otherwise.
+    progress, if given, is called as progress(pass_label, percent, eta_sec)
+    while the two-pass encode runs.
+    target_pix_fmt=None picks bit depth per job (see profiles.selectProfile);
+    profile overrides individual keys of the selected profile.
+    video_codec selects the backend (see backends.py); cpu_used is that
+    encoder's speed setting (cpu-used for libvpx, preset for SVT-AV1) and
+    defaults to the backend's sample or final speed.
     """
 
+    backend = getBackend(video_codec)
+    video_codec = backend.codec
     if cpu_used is None:
-        cpu_used = config.VIDEO_CPU_USED
+        cpu_used = backend.defaultSpeed(test_only)
 
     # ---- get detailed source parameters ----
     source_info = getSourceParams(input_file)
@@ -159,35 +186,29 @@ def encodeFile(input_file, outfile, v_bps, a_bps, duration,
     v_bitrate_str = formatBPSToFfmpeg(v_bps)
     a_bitrate_str = formatBPSToFfmpeg(a_bps)
 
+    # ---- per-job profile: bit depth, lookahead and ARNR by source and tier ----
+    job_profile = backend.selectProfile(src_pix_fmt, forced_resolution, fps_adapt,
+                                        (profile or {}).get('pix_fmt') or target_pix_fmt)
+    if profile:
+        job_profile.update(profile)
+
+    if stats is not None:
+        stats.update({
+            'video_codec': video_codec,
+            'resolution': forced_resolution,
+            'fps': fps_adapt,
+            'cpu_used': cpu_used,
+            'threads': threads,
+            'pix_fmt': job_profile['pix_fmt'],
+        })
+
     print(f"[DEBUG] encodeFile -> v={v_bitrate_str}, a={a_bitrate_str}, res={forced_resolution}, fps={fps_adapt}, channels={audio_channels_local}")
 
     # -----------------------------
     # Video args
     # -----------------------------
-    video_args = {
-        'vcodec': video_codec,
-        'b:v': v_bitrate_str,
-        'g': min(int(fps_adapt * 10), 300),
-        'qmin': config.VIDEO_QMIN,
-        'qmax': config.VIDEO_QMAX,
-        'r': fps_adapt,
-        's': forced_resolution,
-        'undershoot-pct': config.VIDEO_UNDERSHOOT_PCT,
-        'overshoot-pct': config.VIDEO_OVERSHOOT_PCT,
-        'lag-in-frames': config.VIDEO_LAG_IN_FRAMES,
-        'tune': config.VIDEO_TUNE,
-        'quality': config.VIDEO_QUALITY,
-        'cpu-used': cpu_used,
-        'auto-alt-ref': config.VIDEO_AUTO_ALT_REF,
-        'arnr-maxframes': config.VIDEO_ARNR_MAXFRAMES,
-        'arnr-strength': config.VIDEO_ARNR_STRENGTH,
-        'aq-mode': config.VIDEO_AQ_MODE,
-        'row-mt': config.VIDEO_ROW_MT,
-        'tile-columns': config.VIDEO_TILE_COLUMNS,
-        'tile-rows': config.VIDEO_TILE_ROWS,
-        'enable-tpl': config.VIDEO_ENABLE_TPL,
-        'profile:v': config.VIDEO_PROFILE,
-    }
+    video_args = backend.videoArgs(v_bitrate_str, fps_adapt, forced_resolution,
+                                   cpu_used, threads, job_profile)
 
     audio_args = {
         'acodec': audio_codec,
@@ -202,68 +223,102 @@ def encodeFile(input_file, outfile, v_bps, a_bps, duration,
 
     target_args = {
         'threads': threads,
-        'pix_fmt': target_pix_fmt,
+        'pix_fmt': job_profile['pix_fmt'],
     }
 
+    # -----------------------------
+    # Resource governor
+    # -----------------------------
+    if job_class is None:
+        job_class = 'sample' if test_only else 'final'
+    governor = getGovernor()
+    estimate_rss = 0
+    if governor:
+        estimate_rss = governor.estimateRss(forced_resolution, job_profile['lag_in_frames'],
+                                            job_profile['arnr_maxframes'],
+                                            job_profile['high_bitdepth'], src_w, src_h,
+                                            scale=backend.rss_factor)
+
     # -----------------------------
     # Test encode
     # -----------------------------
     if test_only:
+        target_args['t'] = test_seconds
+
+        # identical source window + arguments were measured before: skip ffmpeg
+        sample_key = lambda: cache.sampleKey(input_file, target_container, video_args, audio_args, target_args)
+        cached = cache.lookup(sample_key)
+        if cached:
+            size, wall_sec = cached
+            print(f"[CACHE] Sample {v_bitrate_str}/{a_bitrate_str} -> {size/1024:.0f} KiB (cached)")
+            if stats is not None:
+                stats['pass1_sec'] = wall_sec
+                stats['cached'] = True
+            return size, v_bps, a_bps
+
         fd, tmp = tempfile.mkstemp(suffix="." + target_container)
         os.close(fd)
-        target_args['t'] = test_seconds
         try:
-            (
+            start_time = time.time()
+            test_cmd = (
                 ffmpeg
                 .input(input_file)
                 .output(tmp, format=target_container, **video_args, **audio_args, **target_args)
                 .overwrite_output()
-                .run(quiet=True)
+                .compile()
             )
+            with governedPopen(test_cmd, job_class, estimate_rss, forced_resolution,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE) as proc:
+                out, err = proc.communicate()
+            if proc.returncode != 0:
+                raise ffmpeg.Error('ffmpeg', out, err)
+            wall_sec = time.time() - start_time
+            if stats is not None:
+                stats['pass1_sec'] = wall_sec
             size = os.path.getsize(tmp)
+            cache.store(sample_key, size, wall_sec)
         finally:
             if os.path.exists(tmp):
                 os.remove(tmp)
         return size, v_bps, a_bps
 
     # -----------------------------
-    # Full encode (two-pass)
+    # Full encode (two-pass, or one pass for backends without a stats pass)
     # -----------------------------
-    fd, firstpass_file = tempfile.mkstemp(suffix=".webm")
-    os.close(fd)
-    try:
+    if backend.two_pass:
+        # the first pass only produces the stats log, so its output goes to the null muxer
         first_pass_cmd = (
             ffmpeg.input(input_file)
-                  .output(firstpass_file, **video_args, **target_args,
-                          **{'pass': 1, 'passlogfile': passlogfile, 'an': None})
+                  .output(os.devnull, format='null', **video_args, **target_args,
+                          **backend.passArgs(1, passlogfile), an=None)
                   .global_args('-progress', 'pipe:2')
                   .overwrite_output()
                   .compile()
         )
-
-        second_pass_cmd = (
-            ffmpeg.input(input_file)
-                  .output(outfile, **video_args, **audio_args, **target_args,
-                          **{'pass': 2, 'passlogfile': passlogfile})
-                  .global_args('-progress', 'pipe:2')
-                  .overwrite_output()
-                  .compile()
-        )
-
-        def runWithProgress(cmd, pass_label, duration_sec):
-            print(f"[{pass_label}] Encoding started...")
-            start_time = time.time()
-            duration_ms = max(1, int(duration_sec * 1000))
-            last_update = 0.0
-
-            proc = subprocess.Popen(
-                cmd,
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.PIPE,
-                universal_newlines=True,
-                bufsize=1
-            )
-
+        final_pass_args = backend.passArgs(2, passlogfile)
+    else:
+        first_pass_cmd = None
+        final_pass_args = {}
+
+    second_pass_cmd = (
+        ffmpeg.input(input_file)
+              .output(outfile, **video_args, **audio_args, **target_args, **final_pass_args)
+              .global_args('-progress', 'pipe:2')
+              .overwrite_output()
+              .compile()
+    )
+
+    def runWithProgress(cmd, pass_label, duration_sec, expected_sec=None):
+        print(f"[{pass_label}] Encoding started...")
+        start_time = time.time()
+        duration_ms = max(1, int(duration_sec * 1000))
+        last_update = 0.0
+
+        with governedPopen(cmd, job_class, estimate_rss, forced_resolution,
+                           stdout=subprocess.DEVNULL,
+                           stderr=subprocess.PIPE,
+                           universal_newlines=True,
+                           bufsize=1) as proc:
             while True:
                 line = proc.stderr.readline()
                 if not line:
@@ -271,33 +326,46 @@ def encodeFile(input_file, outfile, v_bps, a_bps, duration,
                         break
                     time.sleep(0.01)
                     continue
-                line = line.strip()
-                if line.startswith("out_time_ms="):
+                out_time_ms = backend.progressMs(line.strip())
+                if out_time_ms is not None:
                     try:
-                        out_time_ms = int(line.split("=", 1)[1])
                         percent = min(out_time_ms / duration_ms * 100.0, 100.0)
                         now = time.time()
                         if now - last_update >= 0.5 and percent > 0:
                             elapsed_time = now - start_time
                             eta = elapsed_time * (100.0 - percent) / percent
+                            if expected_sec:
+                                # trust the historical estimate early, the measured rate later
+                                weight = percent / 100.0
+                                eta = (1.0 - weight) * max(expected_sec - elapsed_time, 0.0) + weight * eta
                             eta_hr, rem = divmod(int(eta), 3600)
                             eta_min, eta_sec = divmod(rem, 60)
                             sys.stdout.write(f"\r[{pass_label}] {percent:.1f}% (ETA {eta_hr:02d}:{eta_min:02d}:{eta_sec:02d})")
                             sys.stdout.flush()
+                            if progress:
+                                progress(pass_label, percent, eta)
                             last_update = now
                     except Exception:
                         continue
             proc.wait()
-            sys.stdout.write("\n")
-            if proc.returncode != 0:
-                raise RuntimeError(f"ffmpeg {pass_label} failed (returncode {proc.returncode})")
-            return proc.returncode
-
-        runWithProgress(first_pass_cmd, "PASS 1", duration)
-        runWithProgress(second_pass_cmd, "PASS 2", duration)
-
-    finally:
-        if os.path.exists(firstpass_file):
-            os.remove(firstpass_file)
+        sys.stdout.write("\n")
+        if proc.returncode != 0:
+            raise RuntimeError(f"ffmpeg {pass_label} failed (returncode {proc.returncode})")
+        return time.time() - start_time
+
+    if expected_sec is None:
+        expected_sec = predictPassSeconds(video_codec, forced_resolution, fps_adapt,
+                                          cpu_used, threads, duration,
+                                          pix_fmt=job_profile['pix_fmt'])
+    expected_p1, expected_p2 = expected_sec if expected_sec else (None, None)
+    if first_pass_cmd:
+        pass1_sec = runWithProgress(first_pass_cmd, "PASS 1", duration, expected_p1)
+        pass2_sec = runWithProgress(second_pass_cmd, "PASS 2", duration, expected_p2)
+    else:
+        pass1_sec = 0.0
+        pass2_sec = runWithProgress(second_pass_cmd, "ENCODE", duration, expected_p2)
+    if stats is not None:
+        stats['pass1_sec'] = pass1_sec
+        stats['pass2_sec'] = pass2_sec
 
     return os.path.getsize(outfile), v_bps, a_bps
@@ -0,0 +1,308 @@
+# governor.py
+import contextlib
+import os
+import signal
+import subprocess
+import threading
+import time
+
+import psutil
+
+from . import config
+
+
+class Governor:
+    """
+    Watch the ffmpeg children we spawn and keep the host out of memory trouble.
+
+    - admit() blocks a new pass until there is memory/CPU headroom for it.
+    - register() applies nice/ionice for the job class and starts tracking
+      the child's RSS, CPU and disk I/O.
+    - Under memory pressure the lowest-priority children are paused with
+      SIGSTOP and resumed with SIGCONT once the pressure is gone, or as soon
+      as no other child is left running.
+    """
+
+    def __init__(self):
+        self._lock = threading.Condition()
+        self._children = {}   # pid -> dict of tracking state
+        self._pending = []    # RSS estimates admitted but not registered yet
+        self._peak_rss = {}   # resolution -> largest RSS seen for it
+        self._last_swap_in = None
+        self._pressure = False
+        self._monitor = None
+
+    # -----------------------------
+    # Admission
+    # -----------------------------
+    def admit(self, job_class, estimate_rss):
+        """
+        Block until a pass expected to peak at estimate_rss bytes fits.
+        Returns a token to hand to register(). A pass is always admitted
+        when nothing else is running, so a single oversized job still runs.
+        """
+        waited = False
+        with self._lock:
+            while self._children or self._pending:
+                reason = self._admissionBlocker(estimate_rss)
+                if reason is None:
+                    break
+                if not waited:
+                    print(f"[GOVERNOR] Holding {job_class} pass: {reason}")
+                    waited = True
+                self._lock.wait(config.GOVERNOR_POLL_SEC)
+            token = [estimate_rss]
+            self._pending.append(token)
+        return token
+
+    def _admissionBlocker(self, estimate_rss):
+        if config.GOVERNOR_MAX_CHILDREN and len(self._children) + len(self._pending) >= config.GOVERNOR_MAX_CHILDREN:
+            return f"{config.GOVERNOR_MAX_CHILDREN} passes already running"
+        if self._pressure and any(c['paused'] for c in self._children.values()):
+            return "running passes are paused for memory pressure"
+
+        # memory children have not grown into yet still counts as spoken for
+        growth = sum(max(c['estimate'] - c['rss'], 0) for c in self._children.values())
+        growth += sum(t[0] for t in self._pending)
+        available = psutil.virtual_memory().available - config.GOVERNOR_MEMORY_RESERVE_BYTES
+        if available - growth < estimate_rss:
+            return (f"needs ~{estimate_rss/1024/1024:.0f} MiB, "
+                    f"{max(available - growth, 0)/1024/1024:.0f} MiB free")
+
+        if psutil.cpu_percent(interval=None) >= config.GOVERNOR_MAX_CPU_PERCENT:
+            return "CPU saturated"
+        return None
+
+    def estimateRss(self, resolution, lag_in_frames, arnr_maxframes, high_bitdepth,
+                    src_w=None, src_h=None, scale=1.0):
+        """
+        Rough peak RSS of one ffmpeg encode: frames held for lookahead/ARNR at
+        the output resolution plus a decode window at the source resolution,
+        times scale for encoders hungrier than libvpx.
+        Raised to the largest RSS actually observed for the same resolution.
+        """
+        out_w, out_h = map(int, resolution.split("x"))
+        bytes_per_px = 3 if high_bitdepth else 1.5
+        buffered = lag_in_frames + 2 * arnr_maxframes + 8
+        estimate = out_w * out_h * bytes_per_px * buffered
+        if src_w and src_h:
+            estimate += src_w * src_h * 1.5 * 16
+        estimate = int(config.GOVERNOR_BASE_RSS_BYTES + estimate * config.GOVERNOR_RSS_FUDGE * scale)
+        with self._lock:
+            return max(estimate, self._peak_rss.get(resolution, 0))
+
+    # -----------------------------
+    # Tracking
+    # -----------------------------
+    def register(self, proc, job_class, token, resolution=None):
+        """Start governing a spawned ffmpeg process."""
+        priority = config.GOVERNOR_JOB_CLASSES.get(job_class, config.GOVERNOR_JOB_CLASSES['final'])
+        try:
+            ps = psutil.Process(proc.pid)
+        except psutil.Error:
+            self._release(token)
+            return
+        _applyPriority(ps, priority)
+
+        with self._lock:
+            if token in self._pending:
+                self._pending.remove(token)
+            self._children[proc.pid] = {
+                'process': ps,
+                'job_class': job_class,
+                'rank': priority['rank'],
+                'pausable': priority['pausable'],
+                'resolution': resolution,
+                'estimate': token[0],
+                'rss': 0,
+                'cpu_percent': 0.0,
+                'read_bytes': 0,
+                'write_bytes': 0,
+                'paused': False,
+                'started': time.time(),
+            }
+            self._ensureMonitor()
+
+    def unregister(self, proc):
+        """Stop governing a process (after it exited or failed)."""
+        with self._lock:
+            child = self._children.pop(proc.pid, None)
+            if child and child['resolution']:
+                peak = self._peak_rss.get(child['resolution'], 0)
+                self._peak_rss[child['resolution']] = max(peak, child['rss'])
+            self._lock.notify_all()
+
+    def _release(self, token):
+        with self._lock:
+            if token in self._pending:
+                self._pending.remove(token)
+            self._lock.notify_all()
+
+    def snapshot(self):
+        """Return a list of per-child stats for status reporting."""
+        with self._lock:
+            return [
+                {k: v for k, v in dict(c, pid=pid).items() if k != 'process'}
+                for pid, c in self._children.items()
+            ]
+
+    def _ensureMonitor(self):
+        if self._monitor is None or not self._monitor.is_alive():
+            self._monitor = threading.Thread(target=self._monitorLoop, name="tinywebm-governor", daemon=True)
+            self._monitor.start()
+
+    def _monitorLoop(self):
+        while True:
+            with self._lock:
+                if not self._children and not self._pending:
+                    self._monitor = None
+                    return
+                self._sample()
+                self._relievePressure()
+                self._lock.notify_all()
+            time.sleep(config.GOVERNOR_POLL_SEC)
+
+    def _sample(self):
+        for pid, child in list(self._children.items()):
+            ps = child['process']
+            try:
+                with ps.oneshot():
+                    child['rss'] = ps.memory_info().rss
+                    child['cpu_percent'] = ps.cpu_percent(interval=None)
+                    try:
+                        io = ps.io_counters()
+                        child['read_bytes'], child['write_bytes'] = io.read_bytes, io.write_bytes
+                    except (AttributeError, psutil.AccessDenied):
+                        pass
+            except psutil.NoSuchProcess:
+                continue
+            if child['resolution']:
+                peak = self._peak_rss.get(child['resolution'], 0)
+                self._peak_rss[child['resolution']] = max(peak, child['rss'])
+
+    def _underPressure(self):
+        available = psutil.virtual_memory().available
+        swap_in = psutil.swap_memory().sin
+        swapping = self._last_swap_in is not None and swap_in - self._last_swap_in > config.GOVERNOR_SWAP_IN_BYTES
+        self._last_swap_in = swap_in
+        if available < config.GOVERNOR_PAUSE_BELOW_BYTES or swapping:
+            return True
+        if available > config.GOVERNOR_RESUME_ABOVE_BYTES:
+            return False
+        return None  # hysteresis band: leave things as they are
+
+    def _relievePressure(self):
+        pressure = self._underPressure()
+        self._pressure = bool(pressure)
+
+        running = [c for c in self._children.values() if not c['paused']]
+        paused = [c for c in self._children.values() if c['paused']]
+
+        if paused and not running:
+            # nothing left running would ever free memory, so waiting cannot help
+            _signal(min(paused, key=lambda c: c['rank']), signal.SIGCONT, False)
+            return
+        if pressure is None:
+            return
+
+        if pressure:
+            # never stop the most important running pass, it is what frees memory
+            candidates = sorted((c for c in running if c['pausable']), key=lambda c: c['rank'], reverse=True)
+            if len(candidates) == len(running):
+                candidates = candidates[:-1]
+            if candidates:
+                _signal(candidates[0], signal.SIGSTOP, True)
+        elif paused:
+            _signal(min(paused, key=lambda c: c['rank']), signal.SIGCONT, False)
+
+
+def _applyPriority(ps, priority):
+    try:
+        ps.nice(priority['nice'])
+    except (psutil.Error, OSError):
+        pass
+    if hasattr(psutil, 'IOPRIO_CLASS_BE'):
+        try:
+            if priority['ionice'] == 'idle':
+                ps.ionice(psutil.IOPRIO_CLASS_IDLE)
+            else:
+                ps.ionice(psutil.IOPRIO_CLASS_BE, value=int(priority['ionice']))
+        except (psutil.Error, OSError, ValueError):
+            pass
+
+
+def _signal(child, sig, paused):
+    try:
+        child['process'].send_signal(sig)
+    except psutil.Error:
+        return
+    child['paused'] = paused
+    action = "Pausing" if paused else "Resuming"
+    print(f"\n[GOVERNOR] {action} {child['job_class']} pass (pid {child['process'].pid})")
+
+
+_governor = None
+_governor_lock = threading.Lock()
+
+# every child started through governedPopen, governed or not, for killChildren()
+_live = set()
+_live_lock = threading.Lock()
+_shutting_down = False
+
+
+def getGovernor():
+    """Return the process-wide governor, or None if governing is disabled or unsupported."""
+    global _governor
+    if not config.GOVERNOR_ENABLED or os.name != 'posix':
+        return None
+    with _governor_lock:
+        if _governor is None:
+            _governor = Governor()
+        return _governor
+
+
+@contextlib.contextmanager
+def governedPopen(cmd, job_class, estimate_rss=0, resolution=None, **popen_kwargs):
+    """
+    subprocess.Popen under the governor: waits for admission, applies the job
+    class priority and tracks the child until the block exits. A child still
+    running when the block exits (e.g. on error) is killed.
+    """
+    governor = getGovernor()
+    token = governor.admit(job_class, estimate_rss) if governor else None
+    try:
+        with _live_lock:
+            if _shutting_down:
+                raise RuntimeError("shutting down, not starting ffmpeg")
+            proc = subprocess.Popen(cmd, **popen_kwargs)
+            _live.add(proc)
+    except Exception:
+        if governor:
+            governor._release(token)
+        raise
+    if governor:
+        governor.register(proc, job_class, token, resolution)
+    try:
+        yield proc
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        with _live_lock:
+            _live.discard(proc)
+        if governor:
+            governor.unregister(proc)
+
+
+def killChildren():
+    """
+    Kill every ffmpeg child started through governedPopen and refuse to
+    start new ones, so a shutting-down process leaves no encodes behind.
+    """
+    global _shutting_down
+    with _live_lock:
+        _shutting_down = True
+        procs = list(_live)
+    for proc in procs:
+        if proc.poll() is None:
+            proc.kill()
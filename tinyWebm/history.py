@@ -0,0 +1,216 @@
+# history.py
+import math
+import os
+import sqlite3
+import statistics
+import time
+import uuid
+
+from . import config
+from .helpers import parse_framerate
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS passes (
+    id              INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at      REAL NOT NULL,
+    job_id          TEXT NOT NULL,
+    pass_index      INTEGER NOT NULL,
+    test_only       INTEGER NOT NULL,
+    source_path     TEXT,
+    src_duration    REAL,
+    src_width       INTEGER,
+    src_height      INTEGER,
+    src_fps         REAL,
+    src_pix_fmt     TEXT,
+    src_video_codec TEXT,
+    src_bitrate     INTEGER,
+    video_codec     TEXT,
+    tier_res        TEXT,
+    tier_fps        REAL,
+    pix_fmt         TEXT,
+    cpu_used        TEXT,
+    threads         INTEGER,
+    duration        REAL,
+    v_bps           INTEGER,
+    a_bps           INTEGER,
+    target_bytes    INTEGER,
+    size_bytes      INTEGER,
+    size_error      REAL,
+    wall_sec        REAL,
+    pass1_sec       REAL,
+    pass2_sec       REAL,
+    encode_fps      REAL
+);
+CREATE INDEX IF NOT EXISTS passes_tier ON passes (video_codec, tier_res, test_only);
+CREATE INDEX IF NOT EXISTS passes_job ON passes (job_id);
+"""
+
+_conn = None
+
+
+def newJobId():
+    """Return a fresh identifier grouping the passes of one encode."""
+    return uuid.uuid4().hex
+
+
+def openHistory(path=None):
+    """
+    Open (and create if needed) the job-history database.
+    Returns a sqlite3 connection, or None if history is disabled or unavailable.
+    The default connection is cached for the lifetime of the process.
+    """
+    global _conn
+
+    if not config.HISTORY_ENABLED:
+        return None
+    if path is None and _conn is not None:
+        return _conn
+
+    db_path = os.path.expanduser(path or config.HISTORY_DB)
+    try:
+        parent = os.path.dirname(db_path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        conn = sqlite3.connect(db_path, timeout=10, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.executescript(_SCHEMA)
+        conn.commit()
+    except sqlite3.Error as e:
+        print(f"[WARN] Job history unavailable ({db_path}): {e}")
+        return None
+
+    if path is None:
+        _conn = conn
+    return conn
+
+
+def recordPass(job_id, pass_index, source_info, stats, duration, v_bps, a_bps,
+               target_bytes, size_bytes, wall_sec, test_only=False, source_path=None,
+               conn=None):
+    """
+    Store one iterativeEncode pass.
+
+    source_info is the dict from getSourceParams, stats is the dict filled in
+    by encodeFile (tier, cpu_used, threads, per-ffmpeg-pass timings).
+    """
+    conn = conn or openHistory()
+    if conn is None:
+        return
+
+    video = (source_info or {}).get('video', {})
+    tier_fps = stats.get('fps') or None
+    frames = duration * tier_fps if tier_fps else None
+    encode_fps = frames / wall_sec if frames and wall_sec else None
+    size_error = (size_bytes / target_bytes) - 1 if target_bytes else None
+
+    try:
+        conn.execute(
+            "INSERT INTO passes (created_at, job_id, pass_index, test_only, source_path,"
+            " src_duration, src_width, src_height, src_fps, src_pix_fmt, src_video_codec,"
+            " src_bitrate, video_codec, tier_res, tier_fps, pix_fmt, cpu_used, threads, duration,"
+            " v_bps, a_bps, target_bytes, size_bytes, size_error, wall_sec, pass1_sec,"
+            " pass2_sec, encode_fps)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                time.time(), job_id, pass_index, int(bool(test_only)), source_path,
+                (source_info or {}).get('duration_sec'),
+                video.get('width'), video.get('height'),
+                parse_framerate(video['avg_frame_rate']) if video.get('avg_frame_rate') else None,
+                video.get('pix_fmt'), video.get('codec_name'), video.get('bitrate_bps'),
+                stats.get('video_codec'), stats.get('resolution'), tier_fps, stats.get('pix_fmt'),
+                str(stats.get('cpu_used')), stats.get('threads'), duration,
+                int(v_bps), int(a_bps), int(target_bytes), int(size_bytes), size_error,
+                wall_sec, stats.get('pass1_sec'), stats.get('pass2_sec'), encode_fps,
+            )
+        )
+        conn.commit()
+    except sqlite3.Error as e:
+        print(f"[WARN] Could not record job history: {e}")
+
+
+def predictPassSeconds(video_codec, tier_res, tier_fps, cpu_used, threads, duration,
+                       pix_fmt=None, conn=None):
+    """
+    Predict wall time of a full two-pass encode from similar past passes.
+
+    Returns (pass1_sec, pass2_sec), or None if there is not enough history.
+    Passes with the same codec, tier and cpu-used are considered; matching
+    thread counts and pixel format are preferred when enough of them exist.
+    """
+    conn = conn or openHistory()
+    if conn is None or not tier_fps or not duration:
+        return None
+
+    rows = _fetch(conn,
+                  "SELECT threads, pix_fmt, duration, tier_fps, pass1_sec, pass2_sec FROM passes"
+                  " WHERE test_only = 0 AND video_codec = ? AND tier_res = ? AND cpu_used = ?"
+                  " AND pass2_sec > 0"
+                  " ORDER BY created_at DESC LIMIT ?",
+                  (video_codec, tier_res, str(cpu_used), config.HISTORY_MAX_NEIGHBOURS))
+
+    for key, value in (('pix_fmt', pix_fmt), ('threads', threads)):
+        matching = [r for r in rows if r[key] == value]
+        if len(matching) >= config.HISTORY_MIN_SAMPLES:
+            rows = matching
+    if len(rows) < config.HISTORY_MIN_SAMPLES:
+        return None
+
+    # per-pass encode speed in output frames per wall second;
+    # single-pass backends record pass1_sec = 0
+    two_pass = [r for r in rows if r['pass1_sec']]
+    frames = duration * tier_fps
+    p2_fps = statistics.median(r['duration'] * r['tier_fps'] / r['pass2_sec'] for r in rows)
+    if not two_pass:
+        return 0.0, frames / p2_fps
+    p1_fps = statistics.median(r['duration'] * r['tier_fps'] / r['pass1_sec'] for r in two_pass)
+    return frames / p1_fps, frames / p2_fps
+
+
+def predictBitrateScale(video_codec, tier_res, src_w, src_h, src_bitrate, conn=None):
+    """
+    Estimate how far the encoder misses the requested bitrate for this kind of source.
+
+    Returns a factor to multiply the requested total bitrate by, so the first
+    pass lands closer to target, or None if there is not enough history.
+    Nearest neighbours are picked by source pixel count and bitrate.
+    """
+    conn = conn or openHistory()
+    if conn is None:
+        return None
+
+    rows = _fetch(conn,
+                  "SELECT src_width, src_height, src_bitrate, duration, v_bps, a_bps, size_bytes"
+                  " FROM passes WHERE video_codec = ? AND tier_res = ? AND size_bytes > 0"
+                  " AND duration > 0 ORDER BY created_at DESC LIMIT ?",
+                  (video_codec, tier_res, config.HISTORY_MAX_NEIGHBOURS * 4))
+    if len(rows) < config.HISTORY_MIN_SAMPLES:
+        return None
+
+    def distance(r):
+        d = 0.0
+        if src_w and src_h and r['src_width'] and r['src_height']:
+            d += abs(math.log((src_w * src_h) / (r['src_width'] * r['src_height'])))
+        if src_bitrate and r['src_bitrate']:
+            d += abs(math.log(src_bitrate / r['src_bitrate']))
+        return d
+
+    nearest = sorted(rows, key=distance)[:config.HISTORY_MAX_NEIGHBOURS]
+    ratios = []
+    for r in nearest:
+        achieved_bps = r['size_bytes'] * 8.0 / r['duration']
+        if achieved_bps > 0:
+            ratios.append((r['v_bps'] + r['a_bps']) / achieved_bps)
+    if len(ratios) < config.HISTORY_MIN_SAMPLES:
+        return None
+
+    scale = statistics.median(ratios)
+    return max(min(scale, config.HISTORY_MAX_SCALE), 1 / config.HISTORY_MAX_SCALE)
+
+
+def _fetch(conn, query, params):
+    try:
+        return conn.execute(query, params).fetchall()
+    except sqlite3.Error as e:
+        print(f"[WARN] Could not read job history: {e}")
+        return []
+
@@ -0,0 +1,301 @@
+# pipeline.py
+import os
+import sys
+import tempfile
+import time
+
+import psutil
+
+from . import config
+from .helpers import computeBitrates, capDictToOriginal, getSourceParams, adaptSettings
+from .ratecontrol import correctBitrates, CONVERGED, STALLED
+from .encoder import encodeFile
+from .backends import getBackend
+from . import history
+from . import cache
+from .streams import spoolInput, OutputSink, STDOUT_NAMES
+
+def iterativeEncode(input_file, output_file, duration, target_size_bytes,
+                    passlogfile, target_container, target_pix_fmt, threads,
+                    init_v_bps, init_a_bps, source_info, reference,
+                    max_passes=5, test_only=False, job_id=None, job_class=None,
+                    progress=None, video_codec=None):
+    """
+    Iteratively encode (sample or full) until filesize converges to target.
+
+    reference holds the source 'v_bps'/'a_bps' the bitrates are capped to.
+    """
+
+    if job_id is None:
+        job_id = history.newJobId()
+
+    src_duration = source_info.get('duration_sec')
+
+    video_bitrate_bps, audio_bitrate_bps = init_v_bps, init_a_bps
+    passes_done = 0
+    total_start = time.time()
+
+    last_size = None
+    last_v_bps = None
+    last_a_bps = None
+
+    # samples of a background job stay background; otherwise encodeFile picks sample/final
+    pass_class = job_class if job_class == 'background' or not test_only else None
+
+    while passes_done < max_passes:
+        if progress and test_only:
+            progress(f"SAMPLE {passes_done + 1}/{max_passes}", None, None)
+        pass_stats = {}
+        pass_start = time.time()
+        size_bytes, video_bitrate_bps, audio_bitrate_bps = encodeFile(
+            input_file,
+            output_file,
+            video_bitrate_bps,
+            audio_bitrate_bps,
+            duration,
+            passlogfile,
+            target_container,
+            target_pix_fmt,
+            threads,
+            cpu_used=None,
+            test_only=test_only,
+            test_seconds=(config.SAMPLE_SECONDS if test_only else None),
+            stats=pass_stats,
+            job_class=pass_class,
+            progress=progress,
+            video_codec=video_codec
+        )
+        passes_done += 1
+
+        # a cached sample has no wall time of its own to learn from
+        if not pass_stats.get('cached'):
+            history.recordPass(job_id, passes_done, source_info, pass_stats, duration,
+                               video_bitrate_bps, audio_bitrate_bps, target_size_bytes,
+                               size_bytes, time.time() - pass_start,
+                               test_only=test_only, source_path=input_file)
+
+        outcome, error_ratio, video_bitrate_bps, audio_bitrate_bps = correctBitrates(
+            size_bytes, target_size_bytes, video_bitrate_bps, audio_bitrate_bps,
+            src_duration, reference, (last_v_bps, last_a_bps, last_size)
+        )
+        if outcome == CONVERGED:
+            break
+        if outcome == STALLED:
+            print(f"[INFO] No significant change detected, stopping retries early after {passes_done} passes")
+            break
+
+        elapsed_total = time.time() - total_start
+        passes_remaining = max_passes - passes_done
+        eta_total_sec = (elapsed_total / passes_done) * passes_remaining if passes_done > 0 else 0
+        eta_hr, rem = divmod(int(eta_total_sec), 3600)
+        eta_min, eta_sec = divmod(rem, 60)
+
+        print(f"[ADJUST {passes_done}/{max_passes}] Size={size_bytes/1024/1024:.2f} MiB "
+              f"(error_ratio {error_ratio:.3f}) -> trying {video_bitrate_bps/1000:.1f}k/"
+              f"{audio_bitrate_bps/1000:.1f}k "
+              f"(Overall ETA {eta_hr:02d}:{eta_min:02d}:{eta_sec:02d})")
+
+        last_v_bps, last_a_bps, last_size = video_bitrate_bps, audio_bitrate_bps, size_bytes
+
+    return size_bytes, video_bitrate_bps, audio_bitrate_bps
+
+
+def encodeJob(input_file, output_file, threads=None, passlogfile=None, job_class=None,
+              progress=None, video_codec=None):
+    """
+    Run the full tinyWebm flow for one file: probe, sample encodes to refine
+    the bitrate, then the iterative full encode.
+
+    input_file may be a local path or anything spoolInput accepts (stdin,
+    a pipe, a file descriptor or file-like object, a URL); non-seekable
+    inputs are copied once to scratch and every pass replays the spool.
+    output_file may be a local path, "-" for stdout (log output goes to
+    stderr meanwhile), or an OutputSink / file descriptor / file-like
+    object / callable. Sinks receive the accepted pass only, streamed from
+    scratch, since a rejected pass cannot be unsent and the WebM cues need
+    a seekable file to be written.
+
+    video_codec picks the encoder backend for this job (default config.VIDEO_CODEC).
+    progress, if given, is called as progress(stage_label, percent, eta_sec).
+    Returns (final_size_bytes, video_bitrate_bps, audio_bitrate_bps).
+    """
+
+    input_path, cleanup_input = spoolInput(input_file)
+    try:
+        if isinstance(output_file, str) and output_file not in STDOUT_NAMES:
+            return _encodeLocal(input_path, output_file, threads, passlogfile, job_class, progress,
+                                video_codec)
+
+        if output_file not in STDOUT_NAMES:
+            sink = output_file if isinstance(output_file, OutputSink) else OutputSink(output_file)
+            return _encodeToSink(input_path, sink, threads, passlogfile, job_class, progress,
+                                 video_codec)
+
+        # the webm owns stdout: our own log lines go to stderr until it is delivered
+        sys.stdout.flush()
+        webm_fd = os.dup(1)
+        os.dup2(2, 1)
+        try:
+            return _encodeToSink(input_path, OutputSink(webm_fd), threads, passlogfile,
+                                 job_class, progress, video_codec)
+        finally:
+            sys.stdout.flush()
+            os.dup2(webm_fd, 1)
+            os.close(webm_fd)
+    finally:
+        cleanup_input()
+
+
+def _encodeToSink(input_path, sink, threads, passlogfile, job_class, progress, video_codec):
+    """encodeJob into a scratch file, then stream the accepted pass to sink."""
+
+    scratch_dir = os.path.expanduser(config.SCRATCH_DIR) if config.SCRATCH_DIR else None
+    fd, scratch_output = tempfile.mkstemp(prefix="tinywebm-out-", suffix="." + config.TARGET_CONTAINER,
+                                          dir=scratch_dir)
+    os.close(fd)
+    try:
+        _, video_bitrate_bps, audio_bitrate_bps = _encodeLocal(
+            input_path, scratch_output, threads, passlogfile, job_class, progress, video_codec)
+        final_size_bytes = sink.deliver(scratch_output)
+    finally:
+        if os.path.exists(scratch_output):
+            os.remove(scratch_output)
+    return final_size_bytes, video_bitrate_bps, audio_bitrate_bps
+
+
+def _encodeLocal(input_file, output_file, threads, passlogfile, job_class, progress, video_codec):
+    """encodeJob for a seekable local input and a local output path."""
+
+    video_codec = getBackend(video_codec).codec
+
+    # derive threads
+    if threads is None:
+        threads = min(psutil.cpu_count() or 1, 8)
+
+    # config variables
+    if passlogfile is None:
+        passlogfile = config.PASSLOGFILE
+    target_filesize_bytes = config.TARGET_FILESIZE_BYTES
+    target_container = config.TARGET_CONTAINER
+    target_pix_format = config.TARGET_PIX_FORMAT
+    max_passes = config.MAX_PASSES
+
+    # ---- get detailed source parameters ----
+    source_info = getSourceParams(input_file)
+
+    if not source_info:
+        raise ValueError("Failed to retrieve source parameters.")
+
+    # ---- unpack format-level metadata ----
+    src_duration           = source_info.get('duration_sec')
+    src_container_bitrate  = source_info.get('bitrate_bps')
+
+    # ---- unpack video stream metadata ----
+    src_video_info         = source_info.get('video', {})
+    src_video_bitrate  = src_video_info.get('bitrate_bps')
+    src_w              = src_video_info.get('width')
+    src_h              = src_video_info.get('height')
+    src_avg_frame_rate     = src_video_info.get('avg_frame_rate')
+
+    # ---- unpack audio stream metadata ----
+    src_audio_info         = source_info.get('audio', {})
+    src_audio_bitrate      = src_audio_info.get('bit_rate')
+
+    # fix missing audio bitrate if applicable
+    if src_audio_bitrate is None and src_container_bitrate is not None and src_video_bitrate is not None:
+        src_audio_bitrate = max(src_container_bitrate - src_video_bitrate, 0)
+
+
+    # ---- compute target bitrates ----
+    target_total_bps = (target_filesize_bytes * 8.0) / src_duration
+    video_bitrate_bps, audio_bitrate_bps = computeBitrates(target_total_bps, src_duration)
+
+    # ---- refine the starting guess from similar past jobs ----
+    _, _, _, initial_res, _, _, _ = adaptSettings(
+        video_bitrate_bps, audio_bitrate_bps,
+        src_res=f"{src_w}x{src_h}" if src_w and src_h else None, src_fps=src_avg_frame_rate
+    )
+    # a source seen before starts where it started then, so its samples hit the cache
+    start_key = lambda: cache.startKey(input_file, video_codec, initial_res)
+    bitrate_scale = cache.lookupStartScale(start_key)
+    if bitrate_scale is None:
+        bitrate_scale = history.predictBitrateScale(video_codec, initial_res, src_w, src_h,
+                                                    src_video_bitrate) or 1.0
+        cache.storeStartScale(start_key, bitrate_scale)
+        if bitrate_scale != 1.0:
+            print(f"[HISTORY] Similar jobs suggest scaling the starting bitrate by {bitrate_scale:.3f}")
+    elif bitrate_scale != 1.0:
+        print(f"[CACHE] Reusing this source's starting bitrate scale {bitrate_scale:.3f}")
+    if bitrate_scale != 1.0:
+        target_total_bps *= bitrate_scale
+        video_bitrate_bps, audio_bitrate_bps = computeBitrates(target_total_bps, src_duration)
+
+    # ---- prepare values and source references for bitrate capping ----
+    values = {
+        'v_bps': video_bitrate_bps,
+        'a_bps': audio_bitrate_bps,
+    }
+
+    reference = {
+        'v_bps': src_video_bitrate,
+        'a_bps': src_audio_bitrate,
+    }
+
+    # ---- apply capping logic ----
+    capped = capDictToOriginal(values, reference)
+
+    video_bitrate_bps = capped['v_bps']
+    audio_bitrate_bps = capped['a_bps']
+
+    job_id = history.newJobId()
+
+    # ---- iterative test encode ----
+    if config.SAMPLE_SECONDS < src_duration:
+        test_target_size = target_filesize_bytes * (config.SAMPLE_SECONDS / src_duration)
+        _, video_bitrate_bps, audio_bitrate_bps = iterativeEncode(
+            input_file, os.path.join("/tmp", "tinywebm_test.webm"),
+            duration=config.SAMPLE_SECONDS,
+            target_size_bytes=test_target_size,
+            passlogfile=passlogfile,
+            target_container=target_container,
+            target_pix_fmt=target_pix_format,
+            threads=threads,
+            init_v_bps=video_bitrate_bps,
+            init_a_bps=audio_bitrate_bps,
+            source_info=source_info,
+            reference=reference,
+            max_passes=max_passes,
+            test_only=True,
+            job_id=job_id,
+            job_class=job_class,
+            progress=progress,
+            video_codec=video_codec
+        )
+
+        print(f"[DEBUG] Duration={src_duration:.2f}s, Refined Video={video_bitrate_bps/1000:.1f}k, "
+              f"Audio={audio_bitrate_bps/1000:.1f}k")
+    else:
+        print(f"[INFO] Video test encode skipped;"
+              f" test sample ({config.SAMPLE_SECONDS} seconds) is more than"
+              f" video length ({src_duration} seconds)")
+
+    # ---- final full encode ----
+    return iterativeEncode(
+        input_file, output_file,
+        duration=src_duration,
+        target_size_bytes=target_filesize_bytes,
+        passlogfile=passlogfile,
+        target_container=target_container,
+        target_pix_fmt=target_pix_format,
+        threads=threads,
+        init_v_bps=video_bitrate_bps,
+        init_a_bps=audio_bitrate_bps,
+        source_info=source_info,
+        reference=reference,
+        max_passes=max_passes,
+        test_only=False,
+        job_id=job_id,
+        job_class=job_class,
+        progress=progress,
+        video_codec=video_codec
+    )
@@ -0,0 +1,77 @@
+# profiles.py
+import re
+
+from . import config
+
+# VP9 profiles for 4:2:0 output: 0 = 8-bit, 2 = 10/12-bit
+VP9_PROFILE_8BIT = 0
+VP9_PROFILE_HIGH_BITDEPTH = 2
+
+# pix_fmt names (endianness stripped) whose number is not bits per component:
+# packed RGB gives bits per pixel, Y21x/XV3x give the layout
+_PACKED_DEPTHS = {
+    'rgb444': 4, 'bgr444': 4, 'rgb555': 5, 'bgr555': 5, 'rgb565': 6, 'bgr565': 6,
+    'rgb48': 16, 'bgr48': 16, 'rgba64': 16, 'bgra64': 16,
+    'y210': 10, 'y212': 12, 'y216': 16, 'xv30': 10, 'xv36': 12, 'v30x': 10,
+}
+
+
+def sourceBitDepth(pix_fmt):
+    """
+    Bits per component of an ffmpeg pix_fmt name, e.g. yuv420p -> 8,
+    yuv420p10le -> 10, p010le -> 10, rgb48le -> 16, rgb555be -> 8.
+    Unknown formats and anything below 8 bits are treated as 8-bit.
+    """
+    if not pix_fmt:
+        return 8
+    match = re.fullmatch(r'(.*?)(\d+)(?:le|be)', pix_fmt)
+    if not match:
+        return 8
+    depth = _PACKED_DEPTHS.get(match.group(1) + match.group(2), int(match.group(2)))
+    if depth > 16:
+        return 8
+    return depth if depth >= 8 else 8
+
+
+def tierSettings(height, fps):
+    """Lookahead/ARNR/tune for an output height, from config.PROFILE_TIERS."""
+    for min_height, settings in config.PROFILE_TIERS:
+        if height >= min_height:
+            chosen = dict(settings)
+            break
+    else:
+        chosen = dict(config.PROFILE_TIERS[-1][1])
+
+    # lookahead is about time, not frames: 25 frames is 4 s at 6 fps
+    if fps and config.PROFILE_LAG_MAX_SECONDS:
+        chosen['lag_in_frames'] = min(chosen['lag_in_frames'],
+                                      max(int(fps * config.PROFILE_LAG_MAX_SECONDS), 1))
+    chosen['arnr_maxframes'] = min(chosen['arnr_maxframes'], chosen['lag_in_frames'])
+    return chosen
+
+
+def selectProfile(src_pix_fmt, resolution, fps, target_pix_fmt=None):
+    """
+    Pick the per-job encoder profile from the probed source pix_fmt and the
+    output tier (resolution/fps from adaptSettings).
+
+    High bit depth is only used for sources that have it (or when
+    config.PROFILE_FORCE_HIGH_BITDEPTH is set); 8-bit sources stay on the
+    faster 8-bit path. target_pix_fmt forces a pixel format.
+
+    Returns a dict with pix_fmt, profile, lag_in_frames, arnr_maxframes,
+    arnr_strength, auto_alt_ref and tune.
+    """
+    if target_pix_fmt:
+        pix_fmt = target_pix_fmt
+    elif sourceBitDepth(src_pix_fmt) > 8 or config.PROFILE_FORCE_HIGH_BITDEPTH:
+        pix_fmt = "yuv420p10le"
+    else:
+        pix_fmt = "yuv420p"
+
+    height = int(resolution.split("x")[1])
+    profile = tierSettings(height, fps)
+    profile['pix_fmt'] = pix_fmt
+    profile['profile'] = VP9_PROFILE_HIGH_BITDEPTH if sourceBitDepth(pix_fmt) > 8 else VP9_PROFILE_8BIT
+    profile['high_bitdepth'] = sourceBitDepth(pix_fmt) > 8
+    return profile
@@ -0,0 +1,69 @@
+# ratecontrol.py
+from . import config
+from .helpers import computeBitrates, capDictToOriginal
+
+# outcomes of one retry-loop step
+CONVERGED, STALLED, RETRY = "converged", "stalled", "retry"
+
+def defaultParams():
+    """The convergence constants iterativeEncode runs with, from config."""
+    return {
+        'tolerance': config.RC_TOLERANCE,
+        'alpha_over': config.RC_ALPHA_OVER,
+        'alpha_under': config.RC_ALPHA_UNDER,
+        'max_correction': config.RC_MAX_CORRECTION,
+        'min_bps_change': config.RC_MIN_BPS_CHANGE,
+        'min_size_change_bytes': config.RC_MIN_SIZE_CHANGE_BYTES,
+    }
+
+
+def correctBitrates(size_bytes, target_size_bytes, video_bitrate_bps, audio_bitrate_bps,
+                    src_duration, reference, last, params=None):
+    """
+    One step of the iterativeEncode retry loop, without any encoding.
+
+    last is (last_v_bps, last_a_bps, last_size) from the previous step, or
+    (None, None, None). Returns (outcome, error_ratio, next_v_bps, next_a_bps):
+    CONVERGED keeps the bitrates that were just used, STALLED and RETRY
+    return the corrected ones.
+    """
+    p = params or defaultParams()
+    last_v_bps, last_a_bps, last_size = last
+
+    # Calculate error ratio
+    error_ratio = size_bytes / target_size_bytes
+    if abs(1 - error_ratio) < p['tolerance']:  # within tolerance of target
+        if size_bytes < target_size_bytes:
+            return CONVERGED, error_ratio, video_bitrate_bps, audio_bitrate_bps
+
+
+    # Smooth correction to avoid oscillation
+    if size_bytes > target_size_bytes:
+        alpha = p['alpha_over']
+    else:
+        alpha = p['alpha_under']
+    correction = alpha * ((1 / error_ratio) - 1)
+
+    # Optional: clamp correction to avoid wild swings
+    max_correction = p['max_correction']
+    correction = max(min(correction, max_correction), -max_correction)
+
+    # Apply correction
+    total_bps = video_bitrate_bps + audio_bitrate_bps
+    corrected_total_bps = total_bps * (1 + correction)
+
+    # Recalculate bitrates
+    video_bitrate_bps, audio_bitrate_bps = computeBitrates(corrected_total_bps, src_duration)
+
+    # ---- cap again ----
+    capped = capDictToOriginal({'v_bps': video_bitrate_bps, 'a_bps': audio_bitrate_bps}, reference)
+    video_bitrate_bps, audio_bitrate_bps = capped['v_bps'], capped['a_bps']
+
+    # prevent stopping too early: require meaningful change
+    if (last_v_bps is not None and abs(video_bitrate_bps - last_v_bps) < p['min_bps_change']
+            and abs(audio_bitrate_bps - last_a_bps) < p['min_bps_change']
+            and last_size is not None and abs(size_bytes - last_size) < p['min_size_change_bytes']
+            and size_bytes < target_size_bytes):
+        return STALLED, error_ratio, video_bitrate_bps, audio_bitrate_bps
+
+    return RETRY, error_ratio, video_bitrate_bps, audio_bitrate_bps
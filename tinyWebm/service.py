@@ -0,0 +1,392 @@
+# service.py
+import json
+import os
+import shutil
+import signal
+import sqlite3
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from . import config
+from .pipeline import encodeJob
+from .governor import getGovernor, killChildren
+from .backends import getBackend
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id            INTEGER PRIMARY KEY AUTOINCREMENT,
+    input_path    TEXT NOT NULL,
+    output_path   TEXT NOT NULL,
+    job_class     TEXT NOT NULL,
+    video_codec   TEXT,
+    source        TEXT NOT NULL,
+    status        TEXT NOT NULL,
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    submitted_at  REAL NOT NULL,
+    started_at    REAL,
+    finished_at   REAL,
+    stage         TEXT,
+    percent       REAL,
+    eta_sec       REAL,
+    size_bytes    INTEGER,
+    v_bps         INTEGER,
+    a_bps         INTEGER,
+    error         TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+CREATE INDEX IF NOT EXISTS jobs_input ON jobs (input_path);
+"""
+
+# statuses
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+VIDEO_EXTENSIONS = (".mkv", ".mp4", ".m4v", ".mov", ".avi", ".webm", ".ts", ".m2ts", ".wmv", ".flv", ".mpg", ".mpeg")
+
+
+class JobQueue:
+    """
+    SQLite-backed job queue. Every state change is committed before the
+    work it describes starts or after it finished, so a restart re-queues
+    jobs that were running and never runs a finished job twice.
+    """
+
+    def __init__(self, path=None):
+        db_path = os.path.expanduser(path or config.SERVICE_QUEUE_DB)
+        parent = os.path.dirname(db_path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False,
+                                     isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript(_SCHEMA)
+
+    def recover(self):
+        """Re-queue jobs left running by a previous process. Returns how many."""
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE jobs SET status = ?, stage = NULL, percent = NULL, eta_sec = NULL"
+                " WHERE status = ?", (QUEUED, RUNNING))
+            return cur.rowcount
+
+    def submit(self, input_path, output_path, job_class="final", source="http", video_codec=None):
+        """
+        Add a job and return its id. A job for the same input/output that is
+        still queued or running is returned instead of adding a duplicate.
+        """
+        input_path = os.path.abspath(input_path)
+        output_path = os.path.abspath(output_path)
+        if _samePath(input_path, output_path):
+            raise ValueError(f"output would overwrite the input: {output_path}")
+        if job_class not in config.GOVERNOR_JOB_CLASSES:
+            raise ValueError(f"Unknown job class: {job_class}")
+        if video_codec is not None:
+            video_codec = getBackend(video_codec).codec
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id FROM jobs WHERE input_path = ? AND output_path = ?"
+                    " AND status IN (?, ?)", (input_path, output_path, QUEUED, RUNNING)).fetchone()
+                if row:
+                    job_id = row['id']
+                else:
+                    job_id = self._conn.execute(
+                        "INSERT INTO jobs (input_path, output_path, job_class, video_codec, source, status,"
+                        " submitted_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (input_path, output_path, job_class, video_codec, source, QUEUED,
+                         time.time())).lastrowid
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return job_id
+
+    def seen(self, path):
+        """
+        True if path is the input or output of any earlier job, whatever its
+        status; a failed watch-folder file is retried by resubmitting it.
+        """
+        path = os.path.abspath(path)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM jobs WHERE output_path = ? OR input_path = ? LIMIT 1",
+                (path, path)).fetchone()
+        return row is not None
+
+    def claim(self):
+        """Atomically move the oldest queued job to running and return it, or None."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT * FROM jobs WHERE status = ? ORDER BY id LIMIT 1", (QUEUED,)).fetchone()
+                if row:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = ?, started_at = ?, attempts = attempts + 1, error = NULL"
+                        " WHERE id = ?", (RUNNING, time.time(), row['id']))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return dict(row) if row else None
+
+    def progress(self, job_id, stage, percent, eta_sec):
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET stage = ?, percent = ?, eta_sec = ? WHERE id = ?",
+                               (stage, percent, eta_sec, job_id))
+
+    def finish(self, job_id, size_bytes, v_bps, a_bps):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, size_bytes = ?, v_bps = ?, a_bps = ?,"
+                " percent = 100.0, eta_sec = 0 WHERE id = ?",
+                (DONE, time.time(), int(size_bytes), int(v_bps), int(a_bps), job_id))
+
+    def fail(self, job_id, error):
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET status = ?, finished_at = ?, error = ? WHERE id = ?",
+                               (FAILED, time.time(), error, job_id))
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def list(self, status=None, limit=100):
+        with self._lock:
+            if status:
+                rows = self._conn.execute("SELECT * FROM jobs WHERE status = ? ORDER BY id DESC LIMIT ?",
+                                          (status, limit)).fetchall()
+            else:
+                rows = self._conn.execute("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        return [dict(r) for r in rows]
+
+
+def defaultOutputPath(input_path, output_dir=None):
+    """
+    <stem>.webm next to the input (or in output_dir), or <stem>.tiny.webm
+    when that would be the input itself.
+    """
+    stem = os.path.splitext(os.path.basename(input_path))[0]
+    output_dir = output_dir or os.path.dirname(os.path.abspath(input_path))
+    output_path = os.path.join(output_dir, f"{stem}.{config.TARGET_CONTAINER}")
+    if _samePath(output_path, input_path):
+        output_path = os.path.join(output_dir, f"{stem}.tiny.{config.TARGET_CONTAINER}")
+    return output_path
+
+
+def _samePath(a, b):
+    return os.path.realpath(a) == os.path.realpath(b)
+
+
+def _runJob(queue, job, scratch_dir, stop):
+    """Encode one claimed job into a partial file and publish it on success."""
+    job_id = job['id']
+    output_path = job['output_path']
+    root, ext = os.path.splitext(output_path)
+    partial_path = f"{root}.partial{ext or '.' + config.TARGET_CONTAINER}"
+    # concurrent jobs must not share ffmpeg's two-pass log
+    passlogfile = os.path.join(scratch_dir, f"job{job_id}-{uuid.uuid4().hex[:8]}")
+
+    last_update = [0.0]
+
+    def progress(stage, percent, eta_sec):
+        now = time.time()
+        if percent is None or now - last_update[0] >= config.SERVICE_PROGRESS_INTERVAL_SEC:
+            queue.progress(job_id, stage, percent, eta_sec)
+            last_update[0] = now
+
+    print(f"[SERVICE] Job {job_id} started: {job['input_path']} -> {output_path}")
+    try:
+        size_bytes, v_bps, a_bps = encodeJob(job['input_path'], partial_path,
+                                             threads=config.SERVICE_THREADS_PER_JOB,
+                                             passlogfile=passlogfile,
+                                             job_class=job['job_class'],
+                                             video_codec=job['video_codec'],
+                                             progress=progress)
+        os.replace(partial_path, output_path)
+    except Exception as e:
+        if stop.is_set():
+            # ffmpeg was killed by the shutdown; the job stays running and recover() re-queues it
+            print(f"[SERVICE] Job {job_id} interrupted by shutdown")
+            return
+        traceback.print_exc()
+        queue.fail(job_id, f"{type(e).__name__}: {e}")
+        print(f"[SERVICE] Job {job_id} failed: {e}")
+        return
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        for suffix in ("-0.log", "-0.log.mbtree"):
+            if os.path.exists(passlogfile + suffix):
+                os.remove(passlogfile + suffix)
+
+    queue.finish(job_id, size_bytes, v_bps, a_bps)
+    print(f"[SERVICE] Job {job_id} done: {size_bytes/1024/1024:.2f} MiB -> {output_path}")
+
+
+def _worker(queue, stop, scratch_dir):
+    while not stop.is_set():
+        job = queue.claim()
+        if job is None:
+            stop.wait(config.SERVICE_POLL_SEC)
+            continue
+        _runJob(queue, job, scratch_dir, stop)
+
+
+def _watchFolder(queue, stop, watch_dir, output_dir):
+    """Submit video files that appear in watch_dir once their size stops changing."""
+    last_sizes = {}
+    while not stop.is_set():
+        try:
+            names = os.listdir(watch_dir)
+        except OSError as e:
+            print(f"[WARN] Cannot read watch folder {watch_dir}: {e}")
+            names = []
+        sizes = {}
+        for name in names:
+            path = os.path.join(watch_dir, name)
+            if (not name.lower().endswith(VIDEO_EXTENSIONS) or ".partial." in name
+                    or not os.path.isfile(path)):
+                continue
+            try:
+                sizes[path] = os.path.getsize(path)
+            except OSError:
+                continue
+            # a file still being copied in keeps growing between polls
+            if last_sizes.get(path) != sizes[path] or queue.seen(path):
+                continue
+            output_path = defaultOutputPath(path, output_dir)
+            job_id = queue.submit(path, output_path, job_class=config.SERVICE_WATCH_JOB_CLASS, source="watch")
+            print(f"[SERVICE] Queued {path} as job {job_id}")
+        last_sizes = sizes
+        stop.wait(config.SERVICE_WATCH_POLL_SEC)
+
+
+def _makeHandler(queue):
+    class Handler(BaseHTTPRequestHandler):
+        """
+        POST /jobs      {"input": ..., "output": ..., "job_class": ..., "video_codec": ...} -> {"id": ...}
+        GET  /jobs      list recent jobs (?status=queued|running|done|failed)
+        GET  /jobs/<id> one job with its progress
+        GET  /status    running ffmpeg children as seen by the governor
+        """
+
+        def _send(self, code, body):
+            data = json.dumps(body).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            path, _, query = self.path.partition("?")
+            parts = [p for p in path.split("/") if p]
+            params = dict(kv.split("=", 1) for kv in query.split("&") if "=" in kv)
+            if parts == ["jobs"]:
+                self._send(200, queue.list(status=params.get("status")))
+            elif len(parts) == 2 and parts[0] == "jobs" and parts[1].isdigit():
+                job = queue.get(int(parts[1]))
+                self._send(200 if job else 404, job or {"error": "no such job"})
+            elif parts == ["status"]:
+                governor = getGovernor()
+                self._send(200, {"children": governor.snapshot() if governor else []})
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path.rstrip("/") != "/jobs":
+                self._send(404, {"error": "not found"})
+                return
+            # a browser can only send JSON after a CORS preflight, which we never answer
+            content_type = self.headers.get("Content-Type", "").split(";")[0].strip().lower()
+            if content_type != "application/json":
+                self._send(415, {"error": "Content-Type must be application/json"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if not isinstance(body, dict):
+                    raise ValueError("body must be a JSON object")
+                input_path = body["input"]
+                if not isinstance(input_path, str):
+                    raise ValueError("input must be a path")
+                output_path = body.get("output")
+                if not output_path:
+                    output_path = defaultOutputPath(input_path)
+                if not os.path.isfile(input_path):
+                    raise ValueError(f"input not found: {input_path}")
+                job_id = queue.submit(input_path, output_path, job_class=body.get("job_class", "final"),
+                                      video_codec=body.get("video_codec"))
+            except (KeyError, TypeError, ValueError) as e:
+                self._send(400, {"error": str(e)})
+                return
+            self._send(201, {"id": job_id})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(workers=None, host=None, port=None, watch_dir=None, watch_output_dir=None):
+    """
+    Run the encode service until interrupted: a worker pool draining the
+    persistent queue, the local HTTP submission API and the optional watch folder.
+    """
+    workers = workers or config.SERVICE_WORKERS
+    host = host or config.SERVICE_HOST
+    port = port or config.SERVICE_PORT
+    watch_dir = watch_dir or config.SERVICE_WATCH_DIR
+    watch_output_dir = watch_output_dir or config.SERVICE_WATCH_OUTPUT_DIR or watch_dir
+
+    queue = JobQueue()
+    # bind first: a second instance fails here instead of re-queueing our running jobs
+    server = ThreadingHTTPServer((host, port), _makeHandler(queue))
+    requeued = queue.recover()
+    if requeued:
+        print(f"[SERVICE] Re-queued {requeued} job(s) interrupted by the last shutdown")
+
+    stop = threading.Event()
+    scratch_dir = tempfile.mkdtemp(prefix="tinywebm-service-")
+    threads = [threading.Thread(target=_worker, args=(queue, stop, scratch_dir),
+                                name=f"tinywebm-worker-{i}", daemon=True)
+               for i in range(workers)]
+    if watch_dir:
+        watch_dir = os.path.expanduser(watch_dir)
+        watch_output_dir = os.path.expanduser(watch_output_dir)
+        os.makedirs(watch_output_dir, exist_ok=True)
+        threads.append(threading.Thread(target=_watchFolder,
+                                        args=(queue, stop, watch_dir, watch_output_dir),
+                                        name="tinywebm-watch", daemon=True))
+    for t in threads:
+        t.start()
+
+    # a service manager stops us with SIGTERM: shut down exactly as on Ctrl-C
+    signal.signal(signal.SIGTERM, _terminate)
+
+    print(f"[SERVICE] Listening on http://{host}:{port} with {workers} worker(s)"
+          + (f", watching {watch_dir}" if watch_dir else ""))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n[SERVICE] Shutting down; running jobs will resume on next start")
+    finally:
+        stop.set()
+        # no ffmpeg may outlive us, or recover() would start a second encode of the same job
+        killChildren()
+        server.server_close()
+        deadline = time.time() + config.SERVICE_SHUTDOWN_GRACE_SEC
+        for t in threads:
+            t.join(max(deadline - time.time(), 0))
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+
+def _terminate(signum, frame):
+    raise KeyboardInterrupt
@@ -0,0 +1,247 @@
+# simulator.py
+#
+# Offline replay of the iterativeEncode retry loop against size-vs-bitrate
+# response curves, so rate-control changes can be judged without encoding:
+#
+#     python -m tinyWebm.simulator --titles 20000
+#     python -m tinyWebm.simulator --param alpha_over=0.6 --param max_correction=0.3
+#     python -m tinyWebm.simulator --history     # curves recorded in the job history
+#
+# Candidate --param values are compared against the current config constants
+# on the same titles and the same noise.
+import argparse
+import bisect
+import math
+import random
+import sqlite3
+import statistics
+import time
+
+from . import config
+from .helpers import computeBitrates, capDictToOriginal, adaptSettings
+from .ratecontrol import correctBitrates, defaultParams, CONVERGED, STALLED
+from . import history
+
+CONTAINER_OVERHEAD = 1.005 # webm framing on top of the stream bitrates
+
+
+class SyntheticTitle:
+    """
+    Made-up title whose encoder response has the effects the retry loop has
+    to cope with: a per-title bias, sub-linear growth, a per-tier bias that
+    jumps when adaptSettings changes resolution, a ceiling for simple content
+    that cannot use the bitrate, and pass-to-pass noise.
+    """
+
+    def __init__(self, rng, max_passes):
+        self.duration = math.exp(rng.uniform(math.log(20 * 60), math.log(3 * 3600)))
+        self.target_size_bytes = config.TARGET_FILESIZE_BYTES
+        self.src_res = rng.choice(["1920x1080", "3840x2160", "1280x720"])
+        self.src_fps = rng.choice(["24000/1001", "24/1", "30/1"])
+        self.src_video_bitrate = int(rng.uniform(2e6, 40e6))
+        self.src_audio_bitrate = int(rng.choice([128e3, 192e3, 384e3, 640e3]))
+
+        self.bias = rng.lognormvariate(0, 0.10)
+        self.elasticity = rng.uniform(0.85, 1.05)
+        self.tier_bias = {}
+        self._tier_seed = rng.random()
+        target_total = self.target_size_bytes * 8.0 / self.duration
+        # simple content (cartoons, slides) that tops out below the budget
+        self.ceiling_bps = target_total * rng.uniform(0.7, 1.0) if rng.random() < 0.15 else None
+        sigma = rng.uniform(0.005, 0.03)
+        self.noise = [rng.gauss(0, sigma) for _ in range(max_passes)]
+        self.v_ref = target_total
+
+    def size(self, v_bps, a_bps, pass_index):
+        _, _, _, res, _, _, _ = adaptSettings(v_bps, a_bps, src_res=self.src_res, src_fps=self.src_fps)
+        if res not in self.tier_bias:
+            # seeded by tier, so every parameter set sees the same jump
+            self.tier_bias[res] = random.Random(f"{self._tier_seed}-{res}").lognormvariate(0, 0.06)
+        video = v_bps * self.bias * self.tier_bias[res] * (v_bps / self.v_ref) ** (self.elasticity - 1)
+        if self.ceiling_bps:
+            video = min(video, self.ceiling_bps)
+        video *= math.exp(self.noise[pass_index])
+        return self.duration * (video + a_bps) / 8.0 * CONTAINER_OVERHEAD
+
+
+class RecordedTitle:
+    """Title replayed from the full-encode passes of one source in the job history."""
+
+    def __init__(self, rows, rng, max_passes, sigma):
+        first = rows[0]
+        self.duration = first['duration']
+        self.target_size_bytes = first['target_bytes']
+        self.src_video_bitrate = first['src_bitrate']
+        self.src_audio_bitrate = None
+        # requested -> achieved total bps, in log space for interpolation
+        points = sorted((math.log(r['v_bps'] + r['a_bps']),
+                         math.log(r['size_bytes'] * 8.0 / r['duration'])) for r in rows)
+        self.xs = [x for x, _ in points]
+        self.ys = [y for _, y in points]
+        self.noise = [rng.gauss(0, sigma) for _ in range(max_passes)]
+
+    def size(self, v_bps, a_bps, pass_index):
+        x = math.log(v_bps + a_bps)
+        if len(self.xs) == 1:
+            y = self.ys[0] + (x - self.xs[0])
+        else:
+            i = min(max(bisect.bisect_left(self.xs, x), 1), len(self.xs) - 1)
+            x0, x1, y0, y1 = self.xs[i - 1], self.xs[i], self.ys[i - 1], self.ys[i]
+            slope = (y1 - y0) / (x1 - x0) if x1 != x0 else 1.0
+            y = y0 + slope * (x - x0)
+        return self.duration * math.exp(y + self.noise[pass_index]) / 8.0
+
+
+def syntheticTitles(count, seed, max_passes):
+    return [SyntheticTitle(random.Random(f"{seed}-{i}"), max_passes) for i in range(count)]
+
+
+def recordedTitles(seed, max_passes, sigma=0.02, db_path=None):
+    """One title per source path with full-encode passes in the job history."""
+    conn = history.openHistory(db_path)
+    if conn is None:
+        return []
+    try:
+        rows = conn.execute(
+            "SELECT source_path, duration, target_bytes, src_bitrate, v_bps, a_bps, size_bytes"
+            " FROM passes WHERE test_only = 0 AND size_bytes > 0 AND duration > 0"
+            " AND target_bytes > 0 ORDER BY source_path").fetchall()
+    except sqlite3.Error as e:
+        print(f"[WARN] Could not read job history: {e}")
+        return []
+    by_source = {}
+    for r in rows:
+        by_source.setdefault(r['source_path'], []).append(r)
+    return [RecordedTitle(title_rows, random.Random(f"{seed}-{path}"), max_passes, sigma)
+            for path, title_rows in by_source.items()]
+
+
+def simulateTitle(title, max_passes, params):
+    """
+    Replay iterativeEncode for one title. Returns a dict with passes,
+    outcome, final size and error.
+    """
+    target_total_bps = (title.target_size_bytes * 8.0) / title.duration
+    v_bps, a_bps = computeBitrates(target_total_bps, title.duration)
+    reference = {'v_bps': title.src_video_bitrate, 'a_bps': title.src_audio_bitrate}
+    capped = capDictToOriginal({'v_bps': v_bps, 'a_bps': a_bps}, reference)
+    v_bps, a_bps = capped['v_bps'], capped['a_bps']
+
+    last = (None, None, None)
+    outcome = "max_passes"
+    passes = 0
+    while passes < max_passes:
+        size_bytes = title.size(v_bps, a_bps, passes)
+        passes += 1
+        step, _, v_bps, a_bps = correctBitrates(size_bytes, title.target_size_bytes, v_bps, a_bps,
+                                                title.duration, reference, last, params)
+        if step in (CONVERGED, STALLED):
+            outcome = step
+            break
+        last = (v_bps, a_bps, size_bytes)
+
+    return {
+        'passes': passes,
+        'outcome': outcome,
+        'size_bytes': size_bytes,
+        'error': size_bytes / title.target_size_bytes - 1,
+    }
+
+
+def simulate(titles, max_passes, params):
+    return [simulateTitle(t, max_passes, params) for t in titles]
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * pct / 100.0), len(ordered) - 1)]
+
+
+def summarize(results):
+    passes = [r['passes'] for r in results]
+    errors = [r['error'] for r in results]
+    abs_errors = [abs(e) for e in errors]
+    n = len(results)
+    return {
+        'titles': n,
+        'converged': sum(r['outcome'] == CONVERGED for r in results) / n,
+        'stalled': sum(r['outcome'] == STALLED for r in results) / n,
+        'max_passes': sum(r['outcome'] == "max_passes" for r in results) / n,
+        'overshoot': sum(e > 0 for e in errors) / n,
+        'passes_mean': statistics.mean(passes),
+        'passes_p50': _percentile(passes, 50),
+        'passes_p90': _percentile(passes, 90),
+        'passes_max': max(passes),
+        'error_mean': statistics.mean(errors),
+        'abs_error_p50': _percentile(abs_errors, 50),
+        'abs_error_p90': _percentile(abs_errors, 90),
+        'abs_error_p99': _percentile(abs_errors, 99),
+    }
+
+
+def printSummaries(summaries):
+    """summaries: list of (label, summary dict), printed side by side."""
+    rows = [
+        ("titles", 'titles', "{:.0f}"),
+        ("converged", 'converged', "{:.1%}"),
+        ("stalled (under target)", 'stalled', "{:.1%}"),
+        ("hit max passes", 'max_passes', "{:.1%}"),
+        ("overshoot (final > target)", 'overshoot', "{:.1%}"),
+        ("passes mean", 'passes_mean', "{:.2f}"),
+        ("passes p50 / p90 / max", None, None),
+        ("final error mean", 'error_mean', "{:+.2%}"),
+        ("|error| p50", 'abs_error_p50', "{:.2%}"),
+        ("|error| p90", 'abs_error_p90', "{:.2%}"),
+        ("|error| p99", 'abs_error_p99', "{:.2%}"),
+    ]
+    print(f"{'':<28}" + "".join(f"{label:>16}" for label, _ in summaries))
+    for title, key, fmt in rows:
+        if key is None:
+            cells = [f"{s['passes_p50']}/{s['passes_p90']}/{s['passes_max']}" for _, s in summaries]
+        else:
+            cells = [fmt.format(s[key]) for _, s in summaries]
+        print(f"{title:<28}" + "".join(f"{c:>16}" for c in cells))
+
+
+def _parseParam(text):
+    key, _, value = text.partition("=")
+    if key not in defaultParams():
+        raise argparse.ArgumentTypeError(f"unknown parameter {key!r} (one of {', '.join(defaultParams())})")
+    return key, float(value)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m tinyWebm.simulator",
+                                     description="Replay the rate-control retry loop without encoding.")
+    parser.add_argument("--titles", type=int, default=10000, help="synthetic titles to simulate")
+    parser.add_argument("--seed", default="tinywebm")
+    parser.add_argument("--max-passes", type=int, default=config.MAX_PASSES)
+    parser.add_argument("--history", action="store_true",
+                        help="replay curves recorded in the job history instead of synthetic titles")
+    parser.add_argument("--param", type=_parseParam, action="append", default=[],
+                        metavar="KEY=VALUE", help="candidate rate-control constant, repeatable")
+    args = parser.parse_args()
+
+    if args.history:
+        titles_factory = lambda: recordedTitles(args.seed, args.max_passes)
+    else:
+        titles_factory = lambda: syntheticTitles(args.titles, args.seed, args.max_passes)
+
+    runs = [("current", defaultParams())]
+    if args.param:
+        runs.append(("candidate", dict(defaultParams(), **dict(args.param))))
+
+    summaries = []
+    for label, params in runs:
+        titles = titles_factory()
+        if not titles:
+            print("[WARN] No titles to simulate")
+            raise SystemExit(1)
+        start = time.time()
+        results = simulate(titles, args.max_passes, params)
+        elapsed = time.time() - start
+        print(f"[SIM] {label}: {len(titles)} titles in {elapsed:.2f}s "
+              f"({len(titles) / max(elapsed, 1e-9):.0f} titles/s)")
+        summaries.append((label, summarize(results)))
+
+    printSummaries(summaries)
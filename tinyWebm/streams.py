@@ -0,0 +1,118 @@
+# streams.py
+import os
+import shutil
+import sys
+import tempfile
+
+import ffmpeg
+
+from . import config
+
+STDIN_NAMES = ("-", "pipe:", "pipe:0")
+STDOUT_NAMES = ("-", "pipe:", "pipe:1")
+
+
+def isSeekableFile(source):
+    """True if source is a local regular file ffmpeg can open (and re-open) itself."""
+    return isinstance(source, str) and source not in STDIN_NAMES and os.path.isfile(source)
+
+
+def spoolInput(source, scratch_dir=None):
+    """
+    Make a non-seekable input re-readable by copying it once to scratch.
+
+    source may be a local path (returned as is), "-"/"pipe:" for stdin, a
+    FIFO path, an open file descriptor, a file-like object with read(), or a
+    URL ffmpeg understands (its first video and audio stream remuxed, not
+    re-encoded, into matroska).
+
+    Returns (path, cleanup) where cleanup() removes the spool, if any.
+    """
+    if isSeekableFile(source):
+        return source, lambda: None
+
+    scratch_dir = scratch_dir or config.SCRATCH_DIR
+    if scratch_dir:
+        os.makedirs(os.path.expanduser(scratch_dir), exist_ok=True)
+        scratch_dir = os.path.expanduser(scratch_dir)
+    fd, spool_path = tempfile.mkstemp(prefix="tinywebm-spool-", suffix=".spool", dir=scratch_dir)
+
+    def cleanup():
+        if os.path.exists(spool_path):
+            os.remove(spool_path)
+
+    try:
+        if isinstance(source, str) and "://" in source:
+            os.close(fd)
+            print(f"[SPOOL] Remuxing {source} to {spool_path}")
+            # only the streams encodeFile uses: matroska refuses data tracks (tmcd,
+            # metadata) and mov_text subtitles that MP4/MOV sources often carry
+            stream = ffmpeg.input(source)
+            (
+                ffmpeg
+                .output(stream['v:0'], stream['a:0?'], spool_path, format="matroska", c="copy")
+                .overwrite_output()
+                .run(quiet=True)
+            )
+        else:
+            with os.fdopen(fd, "wb") as spool:
+                if source in STDIN_NAMES:
+                    reader, close = sys.stdin.buffer, False
+                elif isinstance(source, int):
+                    reader, close = os.fdopen(source, "rb", closefd=False), True
+                elif isinstance(source, str):
+                    reader, close = open(source, "rb"), True
+                else:
+                    reader, close = source, False
+                try:
+                    print(f"[SPOOL] Copying input stream to {spool_path}")
+                    shutil.copyfileobj(reader, spool, config.STREAM_CHUNK_BYTES)
+                finally:
+                    if close:
+                        reader.close()
+    except BaseException:
+        cleanup()
+        raise
+
+    print(f"[SPOOL] Spooled {os.path.getsize(spool_path)/1024/1024:.2f} MiB")
+    return spool_path, cleanup
+
+
+class OutputSink:
+    """
+    Destination for a finished encode that is not a local path: an open file
+    descriptor, a file-like object with write(), or a callable taking bytes.
+    Tracks how many bytes were delivered.
+    """
+
+    def __init__(self, target):
+        if isinstance(target, int):
+            self._write = lambda chunk: _writeAll(target, chunk)
+        elif hasattr(target, "write"):
+            self._write = target.write
+        elif callable(target):
+            self._write = target
+        else:
+            raise TypeError(f"Unsupported output sink: {target!r}")
+        self.bytes_written = 0
+
+    def write(self, chunk):
+        self._write(chunk)
+        self.bytes_written += len(chunk)
+
+    def deliver(self, path):
+        """Stream the file at path into the sink in chunks. Returns its size."""
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(config.STREAM_CHUNK_BYTES)
+                if not chunk:
+                    break
+                self.write(chunk)
+        return self.bytes_written
+
+
+def _writeAll(fd, chunk):
+    view = memoryview(chunk)
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]